@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Compare the sample designs of AFL_SAMPLE_DESIGN (src/afl-fuzz-design.c)
+on synthetic targets: for the same number of executions, how many of the
+invariants DIG infers from the samples still hold on fresh inputs.
+
+python bench_design.py [n_samples ...]
+"""
+
+import sys
+import time
+import logging
+import itertools
+import numpy as np
+from diglib import alg
+
+def primes():
+    for n in itertools.count(2):
+        if all(n % d for d in range(2, int(n ** 0.5) + 1)):
+            yield n
+
+def perm_strata(cnt):
+    # values of a Latin hypercube column
+    return (np.random.permutation(cnt) * 256 + np.random.randint(256, size=cnt)) // cnt
+
+def uniform(cnt, dims):
+    return np.random.randint(256, size=(cnt, dims))
+
+def lhs(cnt, dims):
+    return np.column_stack([perm_strata(cnt) for _ in range(dims)])
+
+def halton(cnt, dims):
+    cols = []
+    for _, base in zip(range(dims), primes()):
+        if base >= cnt:
+            cols.append(perm_strata(cnt))
+            continue
+        perm = np.random.permutation(base)
+        col = []
+        for k in range(1, cnt + 1):
+            h, f = 0.0, 1.0 / base
+            while k:
+                h += f * perm[k % base]
+                k //= base
+                f /= base
+            col.append(int(h * 256))
+        cols.append(col)
+    return np.column_stack(cols)
+
+designs = {'uniform': uniform, 'lhs': lhs, 'halton': halton}
+
+# effector bytes -> outputs
+targets = {
+    'linear': lambda X: np.column_stack((X[:, 0] + 2 * X[:, 1], X[:, 2] - X[:, 3])),
+    'product': lambda X: np.column_stack((X[:, 0] * X[:, 1], X[:, 2])),
+    'branch': lambda X: np.column_stack((np.where(X[:, 0] > X[:, 1], X[:, 2], 0),)),
+}
+
+def run(design, target, cnt, dims=4, n_valid=2000):
+    pos = list(range(dims))
+    X = designs[design](cnt, dims)
+    Y = targets[target](X)
+
+    start = time.time()
+    dig = alg.DigTraces.from_arrays(X, Y, pos)
+    dinvs = dig.start(seed=1.0, maxdeg=None)
+    elapsed = time.time() - start
+    if not dinvs.siz:
+        return 0, 0, elapsed
+
+    # invariants still holding on fresh uniform inputs
+    Xv = uniform(n_valid, dims)
+    valid = alg.DigTraces.from_arrays(Xv, targets[target](Xv), pos).dtraces
+    return dinvs.siz, dinvs.test(valid).siz, elapsed
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    counts = [int(n) for n in sys.argv[1:]] or [20, 40, 80]
+
+    print("target   design    n  invs  valid  valid/exec  dig(s)")
+    for target, cnt, design in itertools.product(targets, counts, designs):
+        np.random.seed(cnt)
+        invs, valid, elapsed = run(design, target, cnt)
+        print(f"{target:8} {design:7} {cnt:4} {invs:5} {valid:6} "
+              f"{valid / cnt:11.3f} {elapsed:7.2f}")
@@ -1,11 +1,15 @@
 import abc
 from collections.abc import Callable
+import functools
+import math
 import pdb
 import random
 import time
 from pathlib import Path
 import sys
+import numpy as np
 from beartype import beartype
+from beartype.typing import Optional
 
 import diglib.settings as settings
 from diglib.helpers.miscs import Miscs, MP
@@ -13,9 +17,9 @@ import diglib.helpers.vcommon as CM
 
 import diglib.data.prog
 from diglib.data.symstates import SymStates
-from diglib.data.traces import DTraces
+from diglib.data.traces import DTraces, TraceMatrix
 
-from diglib.infer.inv import DInvs
+from diglib.infer.inv import DInvs, Invs
 import diglib.infer.nested_array
 import diglib.infer.eqt
 import diglib.infer.oct
@@ -33,9 +37,10 @@ class Dig(metaclass=abc.ABCMeta):
     MINMAX = "minmax"
     CONGRUENCE = "congruence"
     PREPOSTS = "preposts"
+    ARRAYS = "arrays"
 
     @beartype
-    def __init__(self, filename: Path):
+    def __init__(self, filename: Optional[Path]):
         
         mlog.info(f"analyzing '{filename}'")
         self.filename = filename
@@ -59,14 +64,28 @@ class Dig(metaclass=abc.ABCMeta):
         if not dinvs.siz:
             return dinvs
 
+        st = time.time()
+        dinvs = self.check(dinvs, dtraces)
+        if not dinvs.siz:
+            return dinvs
+
+        dinvs = self.simplify(dinvs)
+        self.time_d["simplify"] = time.time() - st
+
+        return dinvs
+
+    @beartype
+    def check(self, dinvs: DInvs, dtraces: DTraces):
         msg = f"check {dinvs.siz} invs using {dtraces.siz} traces"
         mlog.debug(msg)
         st = time.time()
         dinvs = dinvs.test(dtraces)
+        self.time_d["check"] = time.time() - st
         mlog.info(f"{msg} ({time.time() - st:.2f}s)")
-        if not dinvs.siz:
-            return dinvs
+        return dinvs
 
+    @beartype
+    def simplify(self, dinvs: DInvs):
         if settings.DO_SIMPLIFY:
             try:
                 self.symstates.get_solver_stats()
@@ -79,10 +98,9 @@ class Dig(metaclass=abc.ABCMeta):
             mlog.debug(dinvs.__str__(print_stat=False, print_first_n=20))
             st1 = time.time()
             dinvs = dinvs.simplify()
+            self.time_d["simplify"] = time.time() - st1
             mlog.info(f"{msg} ({time.time() - st1:.2f}s)")
 
-        self.time_d["simplify"] = time.time() - st
-
         return dinvs
 
 
@@ -274,7 +292,7 @@ class DigSymStates(Dig, metaclass=abc.ABCMeta):
 
 class DigTraces(Dig):
     @beartype
-    def __init__(self, filename: Path, inv_decls:diglib.data.prog.DSymbs,
+    def __init__(self, filename: Optional[Path], inv_decls:diglib.data.prog.DSymbs,
                  dtraces: DTraces, test_dtraces):
         super().__init__(filename)
 
@@ -292,77 +310,180 @@ class DigTraces(Dig):
             f"got {self.dtraces.siz} traces over {len(self.dtraces)} locs")
         mlog.debug(f"{self.dtraces}")
 
-        tasks = (self._nested_arrays_tasks() + self._eqts_tasks(maxdeg) + self._ieqs_tasks() +
+        self.autodeg = self.get_auto_deg(maxdeg)
+        tasks = (self._nested_arrays_tasks() + self._eqts_tasks() + self._ieqs_tasks() +
                  self._minmax_tasks() + self._congruences_tasks())
 
-        def f(tasks):
-            rs = [(loc, _f(loc)) for loc, _f in tasks]
-            return rs
+        dinvs = self._infer(tasks)
+
+        try:
+            new_traces = self.dtraces.merge(self.test_dtraces)
+            mlog.debug(f"added {new_traces.siz} test traces")
+        except AttributeError:
+            pass  # no test traces
+
+        # keep the (unsimplified) candidates for incremental inference
+        self.cands = self.check(dinvs, self.dtraces) if dinvs.siz else dinvs
+        self.dinvs = self.simplify(self.cands) if self.cands.siz else self.cands
+        return self.dinvs
+
+    def _infer(self, tasks):
+        # picklable, so can run on the MP worker pool
+        f = functools.partial(self._gen_tasks, self)
 
         dinvs = DInvs()
         try:
-            wrs = MP.run_mp("(pure) dynamic inference", tasks, f, settings.DO_MP)
+            wrs = MP.run_mp("(pure) dynamic inference", tasks, f, settings.DO_MP,
+                            cost=self._task_cost)
             for loc, invs in wrs:
                 for inv in invs:
                     dinvs.add(loc, inv)            
         except:
             pass
+        return dinvs
 
-        try:
-            new_traces = self.dtraces.merge(self.test_dtraces)
-            mlog.debug(f"added {new_traces.siz} test traces")
-        except AttributeError:
-            pass  # no test traces
+    @beartype
+    def add_arrays(self, X, Y, pos):
+        """
+        Incremental version of from_arrays + start:
+        add the samples X, Y (usually all samples so far, i.e., the old ones
+        and some new ones) and update the invariants found by start()
+        """
+        loc, _, tm = self._mk_matrix(X, Y, pos)
+        assert loc in self.dtraces and tm.ss == tuple(self.inv_decls[loc].names), loc
+        old_siz = {loc: len(self.dtraces[loc])}
+        new_dtraces = self.dtraces.merge_matrix(loc, tm)
+        return self.update(new_dtraces, old_siz)
 
-        dinvs = self.sanitize(dinvs, self.dtraces)
-        return dinvs
+    @beartype
+    def update(self, new_dtraces: DTraces, old_siz: dict):
+        """
+        new_dtraces were just added to self.dtraces (old_siz[loc] is the
+        number of traces at loc before that).
+        Only test the candidates on the new traces, and only redo the
+        inference of those (loc, typ) whose candidates got falsified.
+        Eqts also are redone if there were too few traces to use the full
+        degree before, as the new traces may allow finding more.
+        """
+        if not new_dtraces.siz:
+            mlog.debug("no new traces")
+            return self.dinvs
+
+        mlog.info(f"got {new_dtraces.siz} new traces")
+        cands, tasks = DInvs(), []
+        for loc in self.dtraces:
+            invs = self.cands.get(loc, Invs())
+            if loc not in new_dtraces:
+                if invs:
+                    cands[loc] = invs
+                continue
+
+            passed = invs.test(new_dtraces[loc]) if invs else invs
+            typs = {self.INV_TYPS[inv.__class__.__name__]
+                    for inv in invs if inv not in passed}
+            if (self.EQTS not in typs and settings.DO_EQTS
+                    and not self.inv_decls[loc].array_only
+                    and old_siz.get(loc, 0) < self._n_eqt_terms(loc)):
+                typs.add(self.EQTS)
+
+            for inv in passed:
+                if self.INV_TYPS[inv.__class__.__name__] not in typs:
+                    cands.add(loc, inv)
+            tasks.extend((loc, typ) for typ in sorted(typs))
+
+        if tasks:
+            mlog.debug(f"redo {tasks}")
+            new_cands = self._infer(tasks)
+            if new_cands.siz:
+                new_cands = self.check(new_cands, self.dtraces)
+            for loc in new_cands:
+                for inv in new_cands[loc]:
+                    cands.add(loc, inv)
+        elif cands.siz == self.cands.siz:
+            # nothing falsified
+            return self.dinvs
+
+        self.cands = cands
+        self.dinvs = self.simplify(cands) if cands.siz else cands
+        return self.dinvs
+
+
+    @staticmethod
+    def _gen_tasks(dig, tasks):
+        return [(loc, dig.gen_from_traces(typ, loc)) for loc, typ in tasks]
+
+    def gen_from_traces(self, typ, loc):
+        traces, symbols = self.dtraces[loc], self.inv_decls[loc]
+        if typ == self.ARRAYS:
+            return diglib.infer.nested_array.Infer.gen_from_traces(traces)
+        elif typ == self.EQTS:
+            return diglib.infer.eqt.Infer.gen_from_traces(self.autodeg, traces, symbols)
+        elif typ == self.IEQS:
+            return diglib.infer.oct.Infer.gen_from_traces(traces, symbols)
+        elif typ == self.MINMAX:
+            return diglib.infer.mp.Infer.gen_from_traces(traces, symbols)
+        else:
+            assert typ == self.CONGRUENCE, typ
+            return diglib.infer.congruence.Infer.gen_from_traces(traces, symbols)
 
-    def _nested_arrays_tasks(self):
-        def _f(l):
-            return diglib.infer.nested_array.Infer.gen_from_traces(self.dtraces[l])
+    # typ of the task that generates each kind of inv
+    INV_TYPS = {"NestedArray": Dig.ARRAYS,
+                "Eqt": Dig.EQTS,
+                "Oct": Dig.IEQS,
+                "MMP": Dig.MINMAX,
+                "Congruence": Dig.CONGRUENCE}
 
-        def _g(l):
-            return self.inv_decls[l].array_only
-        return self._mk_tasks(settings.DO_ARRAYS, _g,  _f)
+    def _n_eqt_terms(self, loc):
+        n_vars = len(self.inv_decls[loc])
+        return math.comb(n_vars + self.autodeg, self.autodeg)
 
-    def _eqts_tasks(self, maxdeg):
-        autodeg = self.get_auto_deg(maxdeg)
+    def _task_cost(self, task):
+        """
+        Rough cost of a (loc, typ) task: #terms (or templates) times #traces
+        """
+        loc, typ = task
+        n_traces = len(self.dtraces[loc])
+        n_vars = len(self.inv_decls[loc])
+        if typ == self.EQTS:
+            n_terms = self._n_eqt_terms(loc)
+            # solving dominates, n_terms^2 per trace used
+            return n_terms * n_terms * min(n_traces, n_terms * settings.TRACE_MULTIPLIER)
+        elif typ == self.IEQS:
+            return 2 * n_vars * n_vars * n_traces
+        elif typ == self.MINMAX:
+            return 4 * n_vars * n_vars * n_vars * n_traces
+        else:
+            return n_vars * n_traces
 
-        def _f(l):
-            return diglib.infer.eqt.Infer.gen_from_traces(autodeg, self.dtraces[l], self.inv_decls[l])
+    def _nested_arrays_tasks(self):
+        def _g(l):
+            return self.inv_decls[l].array_only
+        return self._mk_tasks(settings.DO_ARRAYS, _g, self.ARRAYS)
 
+    def _eqts_tasks(self):
         def _g(l):
             return not self.inv_decls[l].array_only
-        return self._mk_tasks(settings.DO_EQTS, _g, _f)
+        return self._mk_tasks(settings.DO_EQTS, _g, self.EQTS)
 
     def _ieqs_tasks(self):
-        def _f(l):
-            return diglib.infer.oct.Infer.gen_from_traces(self.dtraces[l], self.inv_decls[l])
-
         def _g(l):
             return not self.inv_decls[l].array_only
-        return self._mk_tasks(settings.DO_IEQS, _g,  _f)
+        return self._mk_tasks(settings.DO_IEQS, _g, self.IEQS)
 
     def _minmax_tasks(self):
-        def _f(l):
-            return diglib.infer.mp.Infer.gen_from_traces(self.dtraces[l], self.inv_decls[l])
-
         def _g(l):
             return not self.inv_decls[l].array_only
-        return self._mk_tasks(settings.DO_MINMAXPLUS, _g, _f)
+        return self._mk_tasks(settings.DO_MINMAXPLUS, _g, self.MINMAX)
 
     def _congruences_tasks(self):
-        def _f(l):
-            return diglib.infer.congruence.Infer.gen_from_traces(self.dtraces[l], self.inv_decls[l])
-
         def _g(l):
             return not self.inv_decls[l].array_only
-        return self._mk_tasks(settings.DO_CONGRUENCES, _g,  _f)
+        return self._mk_tasks(settings.DO_CONGRUENCES, _g, self.CONGRUENCE)
 
-    def _mk_tasks(self, cond1, cond2, _f):
+    def _mk_tasks(self, cond1, cond2, typ):
         if not cond1:
             return []
-        return [(loc, _f) for loc in self.dtraces if cond2(loc)]
+        return [(loc, typ) for loc in self.dtraces if cond2(loc)]
 
     @classmethod
     def mk(cls, tracefile, test_tracefile):
@@ -376,3 +497,35 @@ class DigTraces(Dig):
             _, test_dtraces = DTraces.vread(test_tracefile)
 
         return cls(tracefile, inv_decls, dtraces, test_dtraces)
+
+    @classmethod
+    def from_arrays(cls, X, Y, pos):
+        """
+        Build traces directly from integer sample matrices
+        instead of reading them from a csv tracefile
+
+        X = [[2, 3, 4], [5, 6, 7]], Y = [[8], [9]], pos = [1, 30, 44]
+        is the same as reading
+        vtrace1; I x_1; I x_30; I x_44; I y_0
+        vtrace1; 2; 3; 4; 8
+        vtrace1; 5; 6; 7; 9
+        """
+        loc, inv_decls, tm = cls._mk_matrix(X, Y, pos)
+        dtraces = DTraces.from_matrix(loc, tm)
+
+        return cls(None, inv_decls, dtraces, test_dtraces=None)
+
+    @staticmethod
+    def _mk_matrix(X, Y, pos):
+        assert len(X) > 0 and len(X) == len(Y), (len(X), len(Y))
+        assert len(pos) > 0 and len(X[0]) == len(pos), (len(X[0]), len(pos))
+
+        loc = f"{settings.TRACE_INDICATOR}1"
+        names = [f"x_{p}" for p in pos] + [f"y_{i}" for i in range(len(Y[0]))]
+        inv_decls = diglib.data.prog.DSymbs()
+        inv_decls[loc] = diglib.data.prog.Symbs(
+            [diglib.data.prog.Symb(name, "I") for name in names])
+
+        rows = np.hstack((np.asarray(X), np.asarray(Y)))
+        tm = TraceMatrix.mk(inv_decls[loc].names, rows)
+        return loc, inv_decls, tm
@@ -2,6 +2,7 @@ import pdb
 from pathlib import Path
 from collections.abc import Iterable
 import typing
+import numpy as np
 import sympy
 from beartype import beartype
 import z3
@@ -110,8 +111,252 @@ class Trace(SymbsVals):
         return rs
 
 
+class TraceMatrix:
+    """
+    Columnar view of traces over the same variables ss,
+    one row per (unique) trace
+
+    vs is int64 when all values are integers that fit,
+    otherwise an object array of the original (sympy) values
+    """
+
+    INT_MAX = 2**62
+
+    @beartype
+    def __init__(self, ss: tuple, vs: np.ndarray):
+        assert vs.ndim == 2 and vs.shape[1] == len(ss), (ss, vs.shape)
+        self.ss = ss
+        self.vs = vs
+        self.idxs = {s: i for i, s in enumerate(ss)}
+
+    def __len__(self):
+        return self.vs.shape[0]
+
+    def __str__(self):
+        return f"{len(self)} x {len(self.ss)} ({self.vs.dtype})"
+
+    @property
+    def is_int(self):
+        return self.vs.dtype == np.int64
+
+    def col(self, s):
+        return self.vs[:, self.idxs[str(s)]]
+
+    def cols(self, ss):
+        return [self.col(s) for s in ss]
+
+    @classmethod
+    def mk(cls, ss, rows):
+        """
+        Create a matrix from rows of values, dropping duplicate rows
+
+        >>> tm = TraceMatrix.mk(('x', 'y'), [[1, 2], [3, 4], [1, 2]])
+        >>> tm.vs.tolist()
+        [[1, 2], [3, 4]]
+        >>> tm.col('y').tolist()
+        [2, 4]
+        >>> TraceMatrix.mk(('x',), [[sympy.Rational(1, 2)], [2]]).is_int
+        False
+        """
+        vs = cls._to_array(rows)
+        if vs.ndim != 2:
+            vs = vs.reshape(-1, len(ss))
+        return cls(tuple(ss), cls._dedup(vs))
+
+    @classmethod
+    def _to_array(cls, rows):
+        try:
+            vs = np.asarray(rows)
+        except ValueError:
+            vs = np.asarray(rows, dtype=object)
+
+        if vs.dtype.kind in "iub":
+            if vs.size and np.abs(vs).max() >= cls.INT_MAX:
+                return vs.astype(object)
+            return vs.astype(np.int64, copy=False)
+
+        vs = vs.astype(object)
+        if all(cls._is_small_int(v) for v in vs.flat):
+            return vs.astype(np.int64)
+        return vs
+
+    @classmethod
+    def _is_small_int(cls, v):
+        if isinstance(v, sympy.Basic):
+            return v.is_Integer and abs(v) < cls.INT_MAX
+        return isinstance(v, int) and abs(v) < cls.INT_MAX
+
+    @staticmethod
+    def _keys(vs):
+        # hashable key of each row
+        if vs.dtype == object:
+            return map(tuple, vs)
+        return (r.tobytes() for r in np.ascontiguousarray(vs))
+
+    @classmethod
+    def _dedup(cls, vs):
+        # hash rows, keep the first occurrence of each
+        firsts = {}
+        for i, k in enumerate(cls._keys(vs)):
+            firsts.setdefault(k, i)
+
+        if len(firsts) == len(vs):
+            return vs
+        return vs[list(firsts.values())]
+
+    def max_abs(self, ss):
+        """
+        Largest absolute value in the columns ss, as a python int
+        """
+        vs = self.vs[:, [self.idxs[str(s)] for s in ss]]
+        return int(np.abs(vs).max(initial=0))
+
+    def eval(self, ss, f, dtype=None):
+        """
+        Evaluate the compiled function f over the columns ss for all rows,
+        with the columns converted to dtype (object for exact python ints)
+
+        >>> tm = TraceMatrix.mk(('x', 'y'), [[1, 2], [3, 4]])
+        >>> tm.eval(('y', 'x'), lambda y, x: y - x).tolist()
+        [1, 1]
+        >>> tm.eval(('x',), lambda x: x * 2**62, dtype=object).tolist()
+        [4611686018427387904, 13835058055282163712]
+        """
+        cols = self.cols(ss)
+        if dtype is not None:
+            cols = [c.astype(dtype) for c in cols]
+        rs = f(*cols)
+        return np.broadcast_to(rs, (len(self),))
+
+    def merge(self, other):
+        """
+        Return the matrix with the rows of other that are not already here
+        """
+        assert self.ss == other.ss, (self.ss, other.ss)
+        if self.is_int and other.is_int:
+            vs = np.concatenate((self.vs, other.vs))
+        else:
+            vs = np.concatenate((self.vs.astype(object), other.vs.astype(object)))
+        return self.__class__(self.ss, self._dedup(vs))
+
+    def diff(self, other):
+        """
+        Return the matrix of the rows of other that are not here
+
+        >>> tm = TraceMatrix.mk(('x', 'y'), [[1, 2], [3, 4]])
+        >>> tm.diff(TraceMatrix.mk(('x', 'y'), [[3, 4], [5, 6]])).vs.tolist()
+        [[5, 6]]
+        """
+        assert self.ss == other.ss, (self.ss, other.ss)
+        vs, other_vs = self.vs, other.vs
+        if vs.dtype != other_vs.dtype:
+            vs, other_vs = vs.astype(object), other_vs.astype(object)
+
+        olds = set(self._keys(vs))
+        news = [i for i, k in enumerate(self._keys(other_vs)) if k not in olds]
+        return self.__class__(self.ss, other.vs[news])
+
+    def to_traces(self):
+        traces = Traces(Trace(self.ss, tuple(sympy.Integer(v) if isinstance(v, int) else v
+                                             for v in row))
+                        for row in self.vs.tolist())
+        traces._matrix = self
+        return traces
+
+
 class Traces(SymbsValsSet):
 
+    def _changed(self):
+        # the traces changed, the matrix is no longer up to date
+        self.__dict__.pop("_matrix", None)
+
+    @beartype
+    def add(self, t: SymbsVals):
+        self._changed()
+        return super().add(t)
+
+    def update(self, *others):
+        self._changed()
+        return super().update(*others)
+
+    def discard(self, t):
+        self._changed()
+        return super().discard(t)
+
+    def remove(self, t):
+        self._changed()
+        return super().remove(t)
+
+    def pop(self):
+        self._changed()
+        return super().pop()
+
+    def clear(self):
+        self._changed()
+        return super().clear()
+
+    def difference_update(self, *others):
+        self._changed()
+        return super().difference_update(*others)
+
+    def intersection_update(self, *others):
+        self._changed()
+        return super().intersection_update(*others)
+
+    def symmetric_difference_update(self, other):
+        self._changed()
+        return super().symmetric_difference_update(other)
+
+    def __ior__(self, other):
+        self._changed()
+        return super().__ior__(other)
+
+    def __iand__(self, other):
+        self._changed()
+        return super().__iand__(other)
+
+    def __isub__(self, other):
+        self._changed()
+        return super().__isub__(other)
+
+    def __ixor__(self, other):
+        self._changed()
+        return super().__ixor__(other)
+
+    @property
+    def matrix(self):
+        """
+        Return the traces as a TraceMatrix (cached),
+        or None if they are not all scalar traces over the same variables
+
+        >>> traces = TraceMatrix.mk(('x', 'y'), [[0, 2], [3, 4]]).to_traces()
+        >>> traces.discard(Trace.parse(('x', 'y'), ('3', '4')))
+        >>> traces.matrix.vs.tolist()
+        [[0, 2]]
+        >>> traces |= {Trace.parse(('x', 'y'), ('5', '6'))}
+        >>> sorted(traces.matrix.vs.tolist())
+        [[0, 2], [5, 6]]
+        """
+        try:
+            return self._matrix
+        except AttributeError:
+            self._matrix = self._mk_matrix()
+            return self._matrix
+
+    def _mk_matrix(self):
+        if not self:
+            return None
+
+        ss = next(iter(self)).ss
+        if any(t.ss != ss for t in self):
+            return None
+
+        rows = [t.vs for t in self]
+        if any(isinstance(v, Iterable) for v in rows[0]):
+            return None  # array values
+
+        return TraceMatrix.mk(ss, rows)
+
     @beartype
     def __str__(self, printDetails: bool=False):
         if printDetails:
@@ -173,6 +418,36 @@ class Traces(SymbsValsSet):
 
         return exprs
 
+    def instantiate_rows(self, vs, deg, ntraces):
+        """
+        Like instantiate with the template of Miscs.get_template(vs, deg),
+        but return the coefficient rows of the instantiated eqts as a
+        matrix (see Miscs.solve_eqts), evaluated without sympy.
+        Return None if the traces have no matrix over vs.
+
+        >>> traces = TraceMatrix.mk(('x', 'y'), [[0, 2], [3, 4], [1, 0]]).to_traces()
+        >>> traces.instantiate_rows(('x', 'y'), 1, None).tolist()
+        [[1, 0, 2], [1, 3, 4], [1, 1, 0]]
+        >>> traces.instantiate_rows(('x', 'y'), 1, 1).tolist()
+        [[1, 0, 2]]
+        """
+        assert ntraces is None or ntraces >= 1, ntraces
+
+        tm = self.matrix
+        if tm is None or any(v not in tm.idxs for v in vs):
+            return None
+
+        _, exps, _ = Miscs.get_template(tuple(vs), deg)
+        rows = Miscs.eval_terms(exps, np.column_stack(tm.cols(vs)))
+        rows = TraceMatrix._dedup(rows)
+        if ntraces is None:  # use everything
+            return rows
+
+        rows = rows[:ntraces * settings.TRACE_MULTIPLIER]
+        # prefer traces with more 0's, i.e., eqts with fewer uks
+        nterms = np.count_nonzero(rows, axis=1)
+        return rows[np.argsort(nterms, kind="stable")[:ntraces]]
+
     def padzeros(self, ss) :
         new_traces = Traces()
         for t in self:
@@ -191,6 +466,10 @@ class DTraces(dict):
     """
     {loc: Traces}
     """
+    @classmethod
+    def from_matrix(cls, loc: str, tm: TraceMatrix):
+        return cls({loc: tm.to_traces()})
+
     @beartype
     @property
     def siz(self):
@@ -212,6 +491,35 @@ class DTraces(dict):
             self[loc].add(trace)
         return not_in
 
+    @beartype
+    def merge_matrix(self, loc: str, tm: TraceMatrix):
+        """
+        Like merge, but for a matrix that is expected to repeat many traces
+        that are already here (e.g., all samples seen so far).
+        Only the new rows are turned into traces.
+        Return the really new traces (as DTraces).
+        """
+        new_dtraces = DTraces()
+        old = self.get(loc)
+        if old is None or not old:
+            self[loc] = new_dtraces[loc] = tm.to_traces()
+            return new_dtraces
+
+        old_tm = old.matrix
+        if old_tm is None or old_tm.ss != tm.ss:
+            new = [t for t in tm.to_traces() if t not in old]
+            new_tm = None
+        else:
+            new_tm = old_tm.diff(tm)
+            new = new_tm.to_traces() if len(new_tm) else []
+
+        for t in new:
+            old.add(t)
+            new_dtraces.add(loc, t)
+        if new_tm is not None:
+            old._matrix = old_tm.merge(new_tm)
+        return new_dtraces
+
     def merge(self, new_traces):
         """
         add new traces and return those that are really new
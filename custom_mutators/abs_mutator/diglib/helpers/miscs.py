@@ -6,11 +6,18 @@ $ ~/miniconda3/bin/python3 -m doctest -v helpers/miscs.py
 
 from __future__ import annotations
 from collections.abc import Iterable, Callable
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, deque, OrderedDict
 import pdb
+import os
+import math
+import atexit
+import heapq
+import time
 import itertools
 import functools
 import multiprocessing
+import pickle
+import numpy as np
 import sympy
 from sympy.solvers.solveset import linsolve
 import diglib.helpers.vcommon as CM
@@ -49,6 +56,54 @@ class Miscs:
         vs = (v for p in props for v in p.free_symbols)
         return sorted(set(vs), key=str)
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def lambdify(expr):
+        """
+        Compile an expression with integer coefs into a numpy function
+        over its (sorted) variable names, cached per expression.
+        Return (names, f), or None if expr has non-integer numbers
+        (numpy would evaluate them inexactly).
+
+        >>> x, y = sympy.symbols('x y')
+        >>> ss, f = Miscs.lambdify(x + 2*y**2 - 3)
+        >>> ss
+        ('x', 'y')
+        >>> f(np.array([1, 2]), np.array([3, 4])).tolist()
+        [16, 31]
+        >>> Miscs.lambdify(x/2) is None
+        True
+        """
+        if not all(n.is_Integer for n in expr.atoms(sympy.Number)):
+            return None
+        symbols = Miscs.get_vars(expr)
+        f = sympy.lambdify(symbols, expr, "numpy")
+        return tuple(map(str, symbols)), f
+
+    @staticmethod
+    def max_abs(expr, maxv):
+        """
+        Bound on |expr| when none of its variables exceeds maxv in
+        absolute value, e.g., to know if int64 evaluation may overflow
+
+        >>> x, y = sympy.symbols('x y')
+        >>> Miscs.max_abs(3*x*y - 2*x + 5, 10)
+        325
+        >>> Miscs.max_abs(-7, 10)
+        7
+        """
+        return sum(c * maxv ** d for c, d in Miscs._abs_monoms(expr))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _abs_monoms(expr):
+        # (|coef|, degree) of the monomials of expr
+        expr = sympy.sympify(expr)
+        if not expr.free_symbols:
+            return ((abs(int(expr)), 0),)
+        poly = sympy.Poly(expr, *Miscs.get_vars(expr))
+        return tuple((abs(int(c)), sum(m)) for m, c in poly.terms())
+
     str2rat_cache: dict[str, sympy.Rational] = {}
 
     @beartype 
@@ -95,12 +150,65 @@ class Miscs:
         assert deg >= 1, deg
         assert rate >= 0.1, rate
 
+        terms, _, uks = cls.get_template(tuple(vs), deg)
+        n_eqts_needed = int(rate * len(uks))
+        return list(terms), list(uks), n_eqts_needed
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get_template(vs, deg):
+        """
+        Return the terms of get_terms over the variables named vs,
+        their exponent matrix (one row per term) and their uks.
+        Cached, so don't modify the results.
+
+        >>> ts, exps, uks = Miscs.get_template(('a', 'b'), 2)
+        >>> ts
+        (1, a, b, a**2, a*b, b**2)
+        >>> exps.tolist()
+        [[0, 0], [1, 0], [0, 1], [2, 0], [1, 1], [0, 2]]
+        >>> uks
+        (uk_0, uk_1, uk_2, uk_3, uk_4, uk_5)
+        >>> assert Miscs.get_template(('a', 'b'), 2)[0] is ts
+        """
         symbols = [sympy.Symbol(v) for v in vs]
-        terms = cls.get_terms(symbols, deg)
-        uks = cls.create_uks(terms)
+        terms = Miscs.get_terms(symbols, deg)
+        uks = Miscs.create_uks(terms)
         assert not set(terms).intersection(set(uks)), "name conflict"
-        n_eqts_needed = int(rate * len(uks))
-        return terms, uks, n_eqts_needed
+
+        # same order as the combinations of get_terms, 0 stands for 1
+        combs = itertools.combinations_with_replacement(range(len(vs) + 1), deg)
+        exps = np.zeros((len(terms), len(vs)), dtype=np.int64)
+        for i, c in enumerate(combs):
+            for j in c:
+                if j:
+                    exps[i, j - 1] += 1
+        exps.flags.writeable = False
+
+        return tuple(terms), exps, tuple(uks)
+
+    @staticmethod
+    def eval_terms(exps, vs):
+        """
+        Evaluate the terms of the exponent matrix exps over the rows of
+        the value matrix vs (see TraceMatrix), one column per term
+
+        >>> _, exps, _ = Miscs.get_template(('a', 'b'), 2)
+        >>> Miscs.eval_terms(exps, np.array([[2, 3], [1, 5]])).tolist()
+        [[1, 2, 3, 4, 6, 9], [1, 1, 5, 1, 5, 25]]
+        >>> Miscs.eval_terms(exps, np.array([[2**40, 1]])).dtype
+        dtype('O')
+        """
+        assert exps.shape[1] == vs.shape[1], (exps.shape, vs.shape)
+
+        if vs.dtype != object:
+            # stay in int64 unless the largest term may overflow
+            maxv = int(np.abs(vs).max(initial=0))
+            deg = int(exps.sum(axis=1).max(initial=0))
+            if maxv ** deg >= 2**62:
+                vs = vs.astype(object)
+
+        return np.prod(vs[:, None, :] ** exps[None, :, :], axis=2)
 
     @beartype    
     @staticmethod
@@ -340,16 +448,36 @@ class Miscs:
     @beartype
     @classmethod
     def solve_eqts(cls, eqts, terms, uks):
+        """
+        Solve the linear eqts over uks, given as expressions or as their
+        coefficient matrix (see Traces.instantiate_rows), and instantiate
+        the terms with the solutions
+
+        >>> a, b = sympy.symbols('a b')
+        >>> ts, _, uks = Miscs.get_template(('a', 'b'), 1)
+        >>> Miscs.solve_eqts(np.array([[1, 1, 2], [1, 2, 4], [1, 3, 6]]), ts, uks)
+        [Eq(-2*a + b, 0)]
+        """
 
-        assert eqts, eqts
+        assert len(eqts), eqts
         assert terms, terms
         assert uks, uks
         assert len(terms) == len(uks), (terms, uks)
         assert len(eqts) >= len(uks), (len(eqts), len(uks))
 
         mlog.debug(f"solving {len(uks)} uks using {len(eqts)} eqts")
-        sol = linsolve(eqts, uks)
-        vals = list(list(sol)[0])
+        rows = None
+        if len(uks) >= settings.EQT_FF_UKS:
+            rows = cls.get_int_rows(eqts, uks)
+
+        if rows is None:
+            if isinstance(eqts, np.ndarray):
+                eqts = [sum(c * uk for c, uk in zip(row, uks) if c)
+                        for row in eqts.tolist()]
+            sol = linsolve(eqts, uks)
+            vals = list(list(sol)[0])
+        else:
+            vals = cls.nullspace_mod(rows, uks) or cls.nullspace_ff(rows, uks)
 
         if all(v == 0 for v in vals):
             return []
@@ -360,6 +488,211 @@ class Miscs:
         mlog.debug(f"got {len(eqts_)} eqts after refinement")
         return [sympy.Eq(eqt, 0) for eqt in eqts_]
 
+    @staticmethod
+    def get_int_rows(eqts, uks):
+        """
+        Return the integer coefficient rows of linear eqts over uks
+        (expressions or a coefficient matrix), or None if some eqt has
+        non-rational coefficients (e.g., floats)
+
+        >>> uk_0, uk_1, uk_2 = sympy.symbols('uk_0 uk_1 uk_2')
+        >>> Miscs.get_int_rows([uk_0 + 3*uk_2, uk_1/2 - uk_0/3], [uk_0, uk_1, uk_2])
+        [[1, 0, 3], [-2, 3, 0]]
+        >>> Miscs.get_int_rows([uk_0 + 0.5*uk_1], [uk_0, uk_1, uk_2])
+        >>> Miscs.get_int_rows(np.array([[1, sympy.Rational(1, 2), 0]]), [uk_0, uk_1, uk_2])
+        [[2, 1, 0]]
+        """
+        if isinstance(eqts, np.ndarray):
+            if eqts.dtype == np.int64:
+                return eqts.tolist()
+            rows = []
+            for row in eqts.tolist():
+                row = [sympy.sympify(c) for c in row]
+                if not all(c.is_Rational for c in row):
+                    return None
+                denom = math.lcm(*(c.q for c in row))
+                rows.append([int(c * denom) for c in row])
+            return rows
+
+        idxs = {uk: i for i, uk in enumerate(uks)}
+        rows = []
+        for eqt in eqts:
+            row = [sympy.Integer(0)] * len(uks)
+            for t, c in eqt.as_coefficients_dict().items():
+                if not c.is_Rational:
+                    return None
+                if t in idxs:
+                    row[idxs[t]] = c
+                elif c != 0:
+                    return None
+
+            denom = math.lcm(*(c.q for c in row))
+            rows.append([int(c * denom) for c in row])
+
+        return rows
+
+    @staticmethod
+    def nullspace_ff(rows, uks):
+        """
+        Solve the homogeneous system of integer rows over uks using
+        fraction-free Gauss-Jordan elimination, which keeps all entries
+        integral.  Return the solution in the parametric form of linsolve,
+        i.e., free uks map to themselves and the others to rational
+        combinations of the free ones.
+
+        >>> uk_0, uk_1, uk_2 = sympy.symbols('uk_0 uk_1 uk_2')
+        >>> Miscs.nullspace_ff([[1, 0, 3], [-2, 3, 0]], [uk_0, uk_1, uk_2])
+        [-3*uk_2, -2*uk_2, uk_2]
+        >>> assert Miscs.nullspace_ff([[1, 0, 3], [-2, 3, 0]], [uk_0, uk_1, uk_2]) == list(list(linsolve([uk_0 + 3*uk_2, -2*uk_0 + 3*uk_1], [uk_0, uk_1, uk_2]))[0])
+        >>> Miscs.nullspace_ff([[1, 1], [1, -1], [2, 0]], [uk_0, uk_1])
+        [0, 0]
+        """
+        rows = [list(row) for row in rows]
+        pivots = []
+        denom = 1
+        r = 0
+        for c in range(len(uks)):
+            i = next((i for i in range(r, len(rows)) if rows[i][c]), None)
+            if i is None:
+                continue
+
+            rows[r], rows[i] = rows[i], rows[r]
+            prow = rows[r]
+            p = prow[c]
+            for i, row in enumerate(rows):
+                if i == r:
+                    continue
+                a = row[c]
+                # exact division (Bareiss), previous pivots all become p
+                rows[i] = [(p * x - a * y) // denom for x, y in zip(row, prow)]
+
+            denom = p
+            pivots.append(c)
+            r += 1
+            if r == len(rows):
+                break
+
+        frees = [c for c in range(len(uks)) if c not in set(pivots)]
+        vals = [uks[c] for c in range(len(uks))]
+        for row, c in zip(rows, pivots):
+            vals[c] = -sum(sympy.Rational(row[f], denom) * uks[f] for f in frees)
+        return vals
+
+    # primes < 2**31, so that products of residues fit in int64
+    PRIMES = (2147483647, 2147483629, 2147483587, 2147483579,
+              2147483563, 2147483549, 2147483543, 2147483497)
+
+    @staticmethod
+    def rref_mod(A, p):
+        """
+        Reduced row echelon form of the int64 matrix A modulo the prime p.
+        Return the pivot columns and the nonzero rows.
+
+        >>> pivots, R = Miscs.rref_mod(np.array([[2, 4, 1], [1, 2, 0]]), 7)
+        >>> pivots, R.tolist()
+        ([0, 2], [[1, 2, 0], [0, 0, 1]])
+        """
+        A = A % p
+        pivots = []
+        r = 0
+        for c in range(A.shape[1]):
+            nz = np.flatnonzero(A[r:, c])
+            if not nz.size:
+                continue
+
+            i = r + nz[0]
+            A[[r, i]] = A[[i, r]]
+            A[r] = A[r] * pow(int(A[r, c]), -1, p) % p
+            col = A[:, c].copy()
+            col[r] = 0
+            A = (A - np.outer(col, A[r]) % p) % p
+            pivots.append(c)
+            r += 1
+            if r == A.shape[0]:
+                break
+
+        return pivots, A[:r]
+
+    @staticmethod
+    def rat_recon(a, m):
+        """
+        Rational reconstruction: return (n, d) with n/d == a (mod m)
+        and |n|, d <= sqrt(m/2), or None if there is none.
+
+        >>> Miscs.rat_recon(2 * pow(3, -1, 1000003) % 1000003, 1000003)
+        (2, 3)
+        """
+        bound = int((m // 2) ** 0.5)
+        r0, r1, t0, t1 = m, a % m, 0, 1
+        while r1 > bound:
+            q = r0 // r1
+            r0, r1, t0, t1 = r1, r0 - q * r1, t1, t0 - q * t1
+
+        if t1 == 0 or abs(t1) > bound:
+            return None
+        return (r1, t1) if t1 > 0 else (-r1, -t1)
+
+    @classmethod
+    def nullspace_mod(cls, rows, uks):
+        """
+        Like nullspace_ff, but eliminate modulo a few word-sized primes
+        and lift the result to the rationals by CRT and rational
+        reconstruction.  The lifted solution is verified exactly; return
+        None if it cannot be lifted from PRIMES.
+
+        >>> uk_0, uk_1, uk_2 = sympy.symbols('uk_0 uk_1 uk_2')
+        >>> Miscs.nullspace_mod([[1, 0, 3], [-2, 3, 0]], [uk_0, uk_1, uk_2])
+        [-3*uk_2, -2*uk_2, uk_2]
+        >>> Miscs.nullspace_mod([[1, 1], [1, -1], [2, 0]], [uk_0, uk_1])
+        [0, 0]
+        """
+        pivots, coefs, m = None, None, 1
+        for p in cls.PRIMES:
+            pivots_, R = cls.rref_mod(
+                np.array([[x % p for x in row] for row in rows], dtype=np.int64), p)
+
+            # an unlucky prime loses rank or shifts pivots to the right
+            if pivots is not None and pivots_ != pivots:
+                if (len(pivots_), [-c for c in pivots_]) < (len(pivots), [-c for c in pivots]):
+                    continue
+                coefs, m = None, 1
+
+            pivots = pivots_
+            frees = [c for c in range(len(uks)) if c not in set(pivots)]
+            R = R[:, frees].tolist()
+            if coefs is None:
+                coefs = R
+            else:  # CRT
+                inv = pow(m, -1, p)
+                coefs = [[a + m * ((b - a) * inv % p) for a, b in zip(ra, rb)]
+                         for ra, rb in zip(coefs, R)]
+            m *= p
+
+            rats = [[cls.rat_recon(a, m) for a in row] for row in coefs]
+            if any(r is None for row in rats for r in row):
+                continue
+
+            # each free uk gives a nullspace vector, check it exactly
+            ok = True
+            for j, f in enumerate(frees):
+                denom = math.lcm(*(row[j][1] for row in rats))
+                vec = [(f, denom)] + [(c, -row[j][0] * (denom // row[j][1]))
+                                      for c, row in zip(pivots, rats) if row[j][0]]
+                if any(sum(row[c] * x for c, x in vec) for row in rows):
+                    ok = False
+                    break
+
+            if not ok:
+                continue
+
+            vals = list(uks)
+            for c, row in zip(pivots, rats):
+                vals[c] = -sum(sympy.Rational(n, d) * uks[f]
+                               for (n, d), f in zip(row, frees))
+            return vals
+
+        return None
+
     @beartype
     @classmethod
     def instantiate_template(cls, terms, uks, vs):
@@ -447,8 +780,13 @@ class Miscs:
 class MP:
     @beartype    
     @staticmethod
-    def get_workload(tasks, n_cpus):
+    def get_workload(tasks, n_cpus, costs=None):
         """
+        Split tasks into (at most) n_cpus workloads.
+        Without costs, tasks are assigned round-robin.
+        With costs (one per task), tasks are assigned longest-first to the
+        least loaded workload, and workloads are returned heaviest first.
+
         >>> wls = MP.get_workload(range(12),7); [len(wl) for wl in wls]
         [1, 1, 2, 2, 2, 2, 2]
 
@@ -466,10 +804,28 @@ class MP:
 
         >>> wls = MP.get_workload(range(146), 20); [len(wl) for wl in wls]
         [7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 8, 8, 8, 8, 8, 8]
+
+        >>> MP.get_workload("abcdef", 3, costs=[9, 1, 1, 1, 5, 4])
+        [['a'], ['e', 'c'], ['f', 'b', 'd']]
         """
         assert len(tasks) >= 1, tasks
         assert n_cpus >= 1, n_cpus
 
+        if costs is not None:
+            assert len(costs) == len(tasks), (len(costs), len(tasks))
+            n_cpus = min(n_cpus, len(tasks))
+            loads = [(0, cpu_id) for cpu_id in range(n_cpus)]
+            wloads = defaultdict(list)
+            order = sorted(range(len(tasks)), key=lambda i: -costs[i])
+            for i in order:
+                load, cpu_id = heapq.heappop(loads)
+                wloads[cpu_id].append(tasks[i])
+                heapq.heappush(loads, (load + costs[i], cpu_id))
+
+            totals = dict((cpu_id, load) for load, cpu_id in loads)
+            return [wloads[cpu_id] for cpu_id in
+                    sorted(wloads, key=lambda cpu_id: -totals[cpu_id])]
+
         wloads = defaultdict(list)
         for i, task in enumerate(tasks):
             cpu_id = i % n_cpus
@@ -494,43 +850,208 @@ class MP:
         else:
             myQ.put(rs)
 
+    # long-lived worker pool (of pool_size workers),
+    # started on first use and reused across calls
+    pool = None
+    pool_size = 0
+    main_pid = os.getpid()
+
+    # taskname -> [(#tasks, cost, secs)] of the last few workloads
+    task_times = defaultdict(lambda: deque(maxlen=settings.MP_TIMES_SIZ))
+
+    @classmethod
+    def get_pool(cls):
+        if cls.pool is None:
+            n_procs = settings.MP_POOL_SIZE or multiprocessing.cpu_count()
+            ctx = multiprocessing.get_context("fork")
+            cls.pool = ctx.Pool(n_procs)
+            cls.pool_size = n_procs
+            mlog.debug(f"started pool of {n_procs} workers")
+        return cls.pool
+
+    @classmethod
+    def shutdown(cls):
+        if cls.pool is not None and os.getpid() == cls.main_pid:
+            cls.pool.terminate()
+            cls.pool.join()
+        cls.pool = None
+
+    @staticmethod
+    def is_picklable(f):
+        """
+        f can be sent to the pool if it is a module-level function
+        (or a partial of one), closures have to be inherited by forking
+
+        >>> MP.is_picklable(functools.partial(MP.get_workload, range(3)))
+        True
+        >>> MP.is_picklable(lambda tasks: tasks)
+        False
+        """
+        if isinstance(f, functools.partial):
+            f = f.func
+        # closures and lambdas have <locals>/<lambda> in their names
+        return "<" not in getattr(f, "__qualname__", "<")
+
     @beartype            
     @classmethod
-    def run_mp(cls, taskname: str, tasks, f, DO_MP: bool):
+    def run_mp(cls, taskname: str, tasks, f, DO_MP: bool, cost=None):
         """
         Run wprocess on tasks in parallel
+
+        Picklable f (see is_picklable) go to the long-lived worker pool,
+        other f are run by freshly forked workers.
+        Pool workers cannot have children, so they run nested calls
+        themselves.
+
+        cost is an optional (cheap) estimate of how long a task takes,
+        e.g., number of terms times number of traces.  If given, tasks are
+        split longest-first into balanced workloads, and the pool hands
+        out the heaviest ones first to whichever worker is idle.
+        The time of each workload is recorded in task_times.
+
+        The results come workload by workload (in the order get_workload
+        returns them), each in the order of its tasks, whatever order the
+        workers finish in.  This is the order of tasks only without
+        parallelism, so callers must not rely on it beyond being the same
+        for the same tasks (and costs).
         """
 
         n_cpus = multiprocessing.cpu_count()
-        if DO_MP and len(tasks) >= 2 and n_cpus >= 2:
-            Q: multiprocessing.Queue = multiprocessing.Queue()
-            wloads = MP.get_workload(tasks, n_cpus=n_cpus)
-            mlog.debug(
-                f"{taskname}:running {len(tasks)} jobs "
-                f"using {len(wloads)} threads: {list(map(len, wloads))}"
-            )
-
-            workers = [
-                multiprocessing.Process(target=cls.wprocess, args=(f, wl, Q)) for wl in wloads
-            ]
-
-            for w in workers:
-                w.start()
-
-            wrs = []
-            for _ in workers:
-                rs = Q.get()
-                if isinstance(rs, list):
-                    wrs.extend(rs)
-                else:
-                    mlog.debug(f"Got exception from worker: {rs}")
-                    raise rs
+        if (DO_MP and len(tasks) >= 2 and n_cpus >= 2
+                and not multiprocessing.current_process().daemon):
+            costs = None if cost is None else [cost(t) for t in tasks]
+            if cls.is_picklable(f) and os.getpid() == cls.main_pid:
+                wrs, times = cls._run_pool(taskname, tasks, f, costs)
+            else:
+                wrs, times = cls._run_fork(taskname, tasks, f, n_cpus, costs)
+            cls.add_times(taskname, times)
 
         else:
             wrs = cls.wprocess(f, tasks, myQ=None)
 
         return wrs
 
+    @classmethod
+    def add_times(cls, taskname, times):
+        """
+        Record (#tasks, cost, secs) of each workload of a run and
+        log how much the slowest one lagged behind
+
+        >>> MP.add_times("doctest", [(1, 9, 3.0), (2, 5, 1.0)])
+        >>> list(MP.task_times["doctest"])
+        [(1, 9, 3.0), (2, 5, 1.0)]
+        >>> MP.get_stats()["doctest"]
+        {'workloads': 2, 'secs': 4.0, 'max': 3.0, 'skew': 1.5}
+        >>> _ = MP.task_times.pop("doctest")
+        """
+        cls.task_times[taskname].extend(times)
+        ts = [t for _, _, t in times]
+        if ts:
+            mlog.debug(f"{taskname}: {len(ts)} workloads, "
+                       f"max {max(ts):.2f}s, mean {sum(ts) / len(ts):.2f}s")
+
+    @classmethod
+    def get_stats(cls):
+        """
+        Summarize task_times: the skew of a task is the time of its slowest
+        workload over the mean time, 1.0 means perfectly balanced
+        """
+        stats = {}
+        for taskname, times in cls.task_times.items():
+            ts = [t for _, _, t in times]
+            if not ts:
+                continue
+            mean = sum(ts) / len(ts)
+            stats[taskname] = {"workloads": len(ts),
+                               "secs": round(sum(ts), 3),
+                               "max": round(max(ts), 3),
+                               "skew": round(max(ts) / mean, 2) if mean else 1.0}
+        return stats
+
+    @staticmethod
+    def _split(tasks, n_cpus, costs):
+        """
+        The workloads of tasks (each in task order) and their costs
+
+        >>> MP._split("abcdef", 3, costs=[9, 1, 1, 1, 5, 4])
+        ([['a'], ['c', 'e'], ['b', 'd', 'f']], [9, 6, 6])
+        """
+        idxs = MP.get_workload(range(len(tasks)), n_cpus=n_cpus, costs=costs)
+        wloads = [[tasks[i] for i in sorted(wl)] for wl in idxs]
+        wcosts = [None if costs is None else sum(costs[i] for i in wl)
+                  for wl in idxs]
+        return wloads, wcosts
+
+    @classmethod
+    def _run_pool(cls, taskname, tasks, f, costs):
+        pool = cls.get_pool()
+        wloads, wcosts = cls._split(tasks, cls.pool_size * 2, costs)
+
+        mlog.debug(
+            f"{taskname}:running {len(tasks)} jobs "
+            f"using pool of {cls.pool_size}: {list(map(len, wloads))}"
+        )
+
+        # f (e.g., a partial holding all the traces) is pickled once,
+        # each workload then only copies the bytes through the pipe
+        fdata = pickle.dumps(f, protocol=pickle.HIGHEST_PROTOCOL)
+        jobs = [(j, fdata, wl) for j, wl in enumerate(wloads)]
+
+        wrs, times = [None] * len(wloads), []
+        for j, rs, t in pool.imap_unordered(cls._wpool, jobs):
+            wrs[j] = rs
+            times.append((len(wloads[j]), wcosts[j], t))
+        return [r for rs in wrs for r in rs], times
+
+    @classmethod
+    def _wpool(cls, job):
+        j, fdata, wl = job
+        f = pickle.loads(fdata)
+        st = time.time()
+        rs = cls.wprocess(f, wl, myQ=None)
+        return j, rs, time.time() - st
+
+    @classmethod
+    def _wfork(cls, f, j, wl, myQ):
+        st = time.time()
+        try:
+            rs = cls.wprocess(f, wl, myQ=None)
+        except BaseException as ex:
+            rs = ex
+        myQ.put((j, rs, time.time() - st))
+
+    @classmethod
+    def _run_fork(cls, taskname, tasks, f, n_cpus, costs):
+        Q: multiprocessing.Queue = multiprocessing.Queue()
+        wloads, wcosts = cls._split(tasks, n_cpus, costs)
+        mlog.debug(
+            f"{taskname}:running {len(tasks)} jobs "
+            f"using {len(wloads)} threads: {list(map(len, wloads))}"
+        )
+
+        workers = [
+            multiprocessing.Process(target=cls._wfork, args=(f, j, wl, Q))
+            for j, wl in enumerate(wloads)
+        ]
+
+        for w in workers:
+            w.start()
+
+        wrs, times = [None] * len(wloads), []
+        for _ in workers:
+            j, rs, t = Q.get()
+            if isinstance(rs, list):
+                wrs[j] = rs
+                times.append((len(wloads[j]), wcosts[j], t))
+            else:
+                mlog.debug(f"Got exception from worker: {rs}")
+                raise rs
+
+        return [r for rs in wrs for r in rs], times
+
+
+atexit.register(MP.shutdown)
+
 
 if __name__ == "__main__":
     import doctest
@@ -30,6 +30,10 @@ class Eqt(diglib.infer.inv.Inv):
     def mystr(self):
         return f"{self.inv.lhs} == {self.inv.rhs}"
 
+    def get_linear_form(self, idxs):
+        lform = self._get_linear_form(self.inv.lhs - self.inv.rhs, idxs)
+        return None if lform is None else (*lform, True)
+
 
 class Infer(diglib.infer.infer._CEGIR):
 
@@ -51,8 +55,10 @@ class Infer(diglib.infer.infer._CEGIR):
                     f"{len(traces)} traces < {len(uks)} uks, reducing to deg {mydeg}")
                 continue
 
-            template = sum(t*u for t, u in zip(ts, uks))
-            exprs = list(traces.instantiate(template, n_eqts_needed))
+            exprs = traces.instantiate_rows(symbols.names, mydeg, n_eqts_needed)
+            if exprs is None:
+                template = sum(t*u for t, u in zip(ts, uks))
+                exprs = list(traces.instantiate(template, n_eqts_needed))
             if len(exprs) < len(uks):
                 mydeg = mydeg - 1
                 mlog.warning(
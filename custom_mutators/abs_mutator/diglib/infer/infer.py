@@ -1,4 +1,5 @@
 import abc
+import functools
 import pdb
 import sympy
 
@@ -195,11 +196,7 @@ class _Opt(_Infer, metaclass=abc.ABCMeta):
 
         tasks = cls.my_get_terms(symbols.symbolic)
 
-        def f(tasks):
-            rs = [(term, int(max(term.eval_traces(traces)))) 
-                    for term in tasks]
-            return rs
-
+        f = functools.partial(cls._get_upperbounds, traces)
         wrs = MP.run_mp("getting upperbounds", tasks, f, settings.DO_MP)
 
         ps: list[diglib.infer.inv.Inv] = []
@@ -208,3 +205,7 @@ class _Opt(_Infer, metaclass=abc.ABCMeta):
                 p = cls.inv_cls(term.mk_le(upperbound))
                 ps.append(p)
         return ps
+
+    @staticmethod
+    def _get_upperbounds(traces, terms):
+        return [(term, int(term.max_traces(traces))) for term in terms]
@@ -6,6 +6,7 @@ import pdb
 import operator
 from typing import NamedTuple
 
+import numpy as np
 import sympy
 import z3
 from beartype import beartype
@@ -16,6 +17,7 @@ from diglib.helpers.z3utils import Z3
 import diglib.helpers.vcommon as CM
 import diglib.settings as settings
 import diglib.data.traces
+from diglib.data.traces import TraceMatrix
 
 
 DBG = pdb.set_trace
@@ -115,6 +117,39 @@ class Inv(metaclass=abc.ABCMeta):
             mlog.debug(f"{self}: failed test")
             return False
 
+    def get_linear_form(self, idxs):
+        """
+        Return (coefs, c, is_eqt) where the inv is
+        sum(coefs[i] * vi) + c == 0 (is_eqt) or <= 0 otherwise,
+        and idxs maps variable names vi to positions i.
+        Return None if the inv is not linear with integer coefs over idxs.
+        """
+        return None
+
+    @staticmethod
+    def _get_linear_form(p, idxs):
+        """
+        >>> x, y = sympy.symbols('x y')
+        >>> Inv._get_linear_form(x - 2*y + 7, {'x': 0, 'y': 1})
+        ([1, -2], 7)
+        >>> Inv._get_linear_form(x*y - 7, {'x': 0, 'y': 1}) is None
+        True
+        >>> Inv._get_linear_form(x/2 - 7, {'x': 0, 'y': 1}) is None
+        True
+        """
+        coefs = [0] * len(idxs)
+        c = 0
+        for t, v in p.as_coefficients_dict().items():
+            if not v.is_Integer:
+                return None
+            if t == 1:
+                c = int(v)
+            elif t.is_Symbol and t.name in idxs:
+                coefs[idxs[t.name]] = int(v)
+            else:
+                return None
+        return coefs, c
+
     @beartype
     @property
     def expr(self):
@@ -174,7 +209,38 @@ class RelTerm(NamedTuple):
         return Miscs.get_vars(self.term)
 
     def eval_traces(self, traces, pred=None):
-        return traces.myeval(self.term, pred)
+        vs = self.eval_matrix(traces.matrix)
+        if vs is None:
+            return traces.myeval(self.term, pred)
+
+        vs = vs.tolist()
+        return vs if pred is None else any(pred(v) for v in vs)
+
+    def eval_matrix(self, tm):
+        """
+        Evaluate the term over all traces at once using the compiled term,
+        return None if it cannot be done exactly
+        """
+        if tm is None or not tm.is_int:
+            return None
+        compiled = Miscs.lambdify(self.term)
+        if compiled is None:
+            return None
+        ss, f = compiled
+        if Miscs.max_abs(self.term, tm.max_abs(ss)) >= TraceMatrix.INT_MAX:
+            # int64 could overflow, evaluate over python ints
+            return tm.eval(ss, f, dtype=object)
+        return tm.eval(ss, f)
+
+    def max_traces(self, traces):
+        """
+        >>> x, y = sympy.symbols('x y')
+        >>> traces = TraceMatrix.mk(('x', 'y'), [[2**40, 2**40], [1, 2]]).to_traces()
+        >>> RelTerm(x*y).max_traces(traces) == 2**80
+        True
+        """
+        vs = self.eval_matrix(traces.matrix)
+        return max(traces.myeval(self.term)) if vs is None else vs.max()
 
     def mk_lt(self, val):
         return self._mk_rel(operator.lt, val)
@@ -222,12 +288,18 @@ class Invs(set):
     def test(self, traces):
         assert self, self
 
-        def f(tasks):
-            return [(inv, inv.test(traces)) for inv in tasks]
+        myinvs = set()
+        invs = list(self)
+        tm = traces.matrix
+        if tm is not None and tm.is_int:
+            wrs, invs = self._test_linear(invs, tm)
+        else:
+            wrs = []
 
-        wrs = MP.run_mp("test", list(self), f, settings.DO_MP)
+        if invs:
+            f = functools.partial(self._test, traces)
+            wrs.extend(MP.run_mp("test", invs, f, settings.DO_MP))
 
-        myinvs = set()
         for inv, passed in wrs:
             if passed:
                 myinvs.add(inv)
@@ -240,6 +312,46 @@ class Invs(set):
     def simplify(self):
         return self.__class__(self.cinvs.simplify())
 
+    @staticmethod
+    def _test(traces, invs):
+        return [(inv, inv.test(traces)) for inv in invs]
+
+    @staticmethod
+    def _test_linear(invs, tm):
+        """
+        Check invs that are linear over the trace variables (e.g., Eqt, Oct)
+        against all traces using a single matrix product.
+        Return [(inv, passed)] for those and the remaining (nonlinear) invs.
+        """
+        lforms, others = [], []
+        for inv in invs:
+            lform = inv.get_linear_form(tm.idxs)
+            if lform is None:
+                others.append(inv)
+            else:
+                lforms.append((inv, lform))
+
+        if not lforms:
+            return [], others
+
+        coefs = np.array([coefs for _, (coefs, _, _) in lforms], dtype=object)
+        cs = np.array([c for _, (_, c, _) in lforms], dtype=object)
+        is_eqts = np.array([is_eqt for _, (_, _, is_eqt) in lforms])
+
+        # skip traces with extreme large values, like test_single_trace
+        vs = tm.vs[(tm.vs <= settings.TRACE_MAX_VAL).all(axis=1)]
+        if len(vs):
+            maxv = int(np.abs(vs).max()) * len(tm.ss)
+            maxv = maxv * int(np.abs(coefs).max()) + int(np.abs(cs).max())
+            if maxv < TraceMatrix.INT_MAX:
+                coefs, cs = coefs.astype(np.int64), cs.astype(np.int64)
+            else:
+                vs = vs.astype(object)  # exact python ints
+
+        rs = vs.dot(coefs.T) + cs
+        passed = np.where(is_eqts, (rs == 0).all(axis=0), (rs <= 0).all(axis=0))
+        return [(inv, bool(p)) for (inv, _), p in zip(lforms, passed)], others
+
 
 class CInvs:
     """
@@ -296,6 +408,33 @@ class CInvs:
             return None
 
 
+    def to_matrix(self, var_order):
+        """
+        Return ((A_eq, b_eq), (A_le, b_le)), the linear eqts and octs as
+        A_eq x == b_eq and A_le x <= b_le over the variables named in
+        var_order.  Invs that are not linear with integer coefs over
+        var_order (e.g., nonlinear eqts) have no row.
+
+        >>> import diglib.infer.eqt, diglib.infer.oct
+        >>> x, y = sympy.symbols('x y')
+        >>> invs = Invs([diglib.infer.eqt.Eqt(sympy.Eq(x - 2*y - 3, 0)),
+        ...              diglib.infer.eqt.Eqt(sympy.Eq(x*y - 4, 0)),
+        ...              diglib.infer.oct.Oct(x - y <= 7)])
+        >>> (A_eq, b_eq), (A_le, b_le) = invs.cinvs.to_matrix(('y', 'x'))
+        >>> A_eq.tolist(), b_eq.tolist(), A_le.tolist(), b_le.tolist()
+        ([[-2, 1]], [3], [[-1, 1]], [7])
+        """
+        idxs = {v: i for i, v in enumerate(var_order)}
+
+        def f(invs):
+            lforms = [inv.get_linear_form(idxs) for inv in invs]
+            lforms = [lform for lform in lforms if lform is not None]
+            A = np.array([coefs for coefs, _, _ in lforms], dtype=np.int64)
+            b = np.array([-c for _, c, _ in lforms], dtype=np.int64)
+            return A.reshape(len(lforms), len(idxs)), b
+
+        return f(self.eqts + self.eqts_largecoefs), f(self.octs)
+
     def __str__(self, print_stat=False, print_first_n=None,
                 writeresults=False):
         ss = []
@@ -415,7 +554,8 @@ class CInvs:
             return [p for p in ps if not Z3._imply(conj, cls._get_expr(p))]
 
         wrs = MP.run_mp(
-            f"_simplify_fast {len(ps)} {msg}", ps, f, settings.DO_MP)
+            f"_simplify_fast {len(ps)} {msg}", ps, f, settings.DO_MP,
+            cost=lambda p: len(str(p)))
 
         Miscs.show_removed(f"_simplify_fast {msg}", len(
             ps), len(wrs), time() - st)
@@ -522,10 +662,9 @@ class DInvs(dict):
         st = time()
         tasks = [loc for loc in self if self[loc]]
 
-        def f(tasks):
-            return [(loc, self[loc].test(dtraces[loc])) for loc in tasks]
-
-        wrs = MP.run_mp("test_dinvs", tasks, f, settings.DO_MP)
+        f = functools.partial(self._test, self, dtraces)
+        wrs = MP.run_mp("test_dinvs", tasks, f, settings.DO_MP,
+                        cost=lambda loc: len(self[loc]) * len(dtraces[loc]))
         dinvs = DInvs({loc: invs for loc, invs in wrs if invs})
         Miscs.show_removed("test_dinvs", self.siz, dinvs.siz, time() - st)
         return dinvs
@@ -557,15 +696,22 @@ class DInvs(dict):
 
         st = time()
 
-        def f(tasks):
-            return [(loc, self[loc].simplify()) for loc in tasks]
-
-        wrs = MP.run_mp("simplify", list(self), f, settings.DO_MP)
+        f = functools.partial(self._simplify, self)
+        wrs = MP.run_mp("simplify", list(self), f, settings.DO_MP,
+                        cost=lambda loc: len(self[loc]) ** 2)
         mlog.debug("done simplifying , time {}".format(time() - st))
         dinvs = self.__class__((loc, invs) for loc, invs in wrs if invs)
         Miscs.show_removed("simplify", self.siz, dinvs.siz, time() - st)
         return dinvs
 
+    @staticmethod
+    def _test(dinvs, dtraces, locs):
+        return [(loc, dinvs[loc].test(dtraces[loc])) for loc in locs]
+
+    @staticmethod
+    def _simplify(dinvs, locs):
+        return [(loc, dinvs[loc].simplify()) for loc in locs]
+
     @beartype
     @classmethod
     def mk_false_invs(cls, locs):
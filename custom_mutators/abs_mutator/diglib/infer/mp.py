@@ -2,6 +2,7 @@ import pdb
 import itertools
 import typing
 import functools
+import numpy as np
 import sympy
 import z3
 
@@ -18,6 +19,14 @@ DBG = pdb.set_trace
 mlog = CM.getLogger(__name__, settings.LOGGER_LEVEL)
 
 
+def _vmax(*xs):
+    return functools.reduce(np.maximum, xs)
+
+
+def _vmin(*xs):
+    return functools.reduce(np.minimum, xs)
+
+
 class Term(typing.NamedTuple):
     a: tuple
     b: tuple
@@ -64,15 +73,47 @@ class Term(typing.NamedTuple):
         return self.mk(a, b, self.is_max)
 
     def eval_traces(self, traces: diglib.data.traces.Traces, pred=None):
-        if pred is None:
-            return [
-                self._eval(self.__str__(use_lambda=True), t.mydict_str) for t in traces
-            ]
-        else:
-            return any(
-                pred(self._eval(self.__str__(use_lambda=True), t.mydict_str))
-                for t in traces
-            )
+        vs = self.eval_matrix(traces.matrix)
+        vs = self._eval_each(traces) if vs is None else vs.tolist()
+        return list(vs) if pred is None else any(pred(v) for v in vs)
+
+    def _eval_each(self, traces):
+        lambda_str = self.__str__(use_lambda=True)
+        return (self._eval(lambda_str, t.mydict_str) for t in traces)
+
+    def eval_matrix(self, tm):
+        """
+        Evaluate the term over all traces at once using the compiled
+        lambda, return None if it cannot be done exactly
+        """
+        if tm is None or not tm.is_int:
+            return None
+        f = self._lambdify(self.__str__(use_lambda=True))
+        ss = f.__code__.co_varnames
+        maxv = tm.max_abs(ss)
+        if (max(Miscs.max_abs(t, maxv) for t in self.a) +
+                max(Miscs.max_abs(t, maxv) for t in self.b)
+                >= diglib.data.traces.TraceMatrix.INT_MAX):
+            # int64 could overflow, evaluate over python ints
+            return tm.eval(ss, f, dtype=object)
+        return tm.eval(ss, f)
+
+    def max_traces(self, traces):
+        vs = self.eval_matrix(traces.matrix)
+        return max(self._eval_each(traces)) if vs is None else vs.max()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _lambdify(lambda_str: str):
+        """
+        Compile lambda_str with element-wise max/min (cached per lambda_str)
+
+        >>> f = Term._lambdify('lambda x,y: max(x - 13, y, -3)')
+        >>> f(np.array([11, 20]), np.array([-5, 1])).tolist()
+        [-2, 7]
+        """
+        assert isinstance(lambda_str, str) and "lambda" in lambda_str
+        return eval(lambda_str, {"max": _vmax, "min": _vmin})
 
     @classmethod
     def get_terms(cls, terms):
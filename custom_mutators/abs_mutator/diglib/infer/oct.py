@@ -40,6 +40,10 @@ class Oct(diglib.infer.inv.Inv):
     def mystr(self):
         return f"{self.inv.lhs} <= {self.inv.rhs}"
 
+    def get_linear_form(self, idxs):
+        lform = self._get_linear_form(self.inv.lhs - self.inv.rhs, idxs)
+        return None if lform is None else (*lform, False)
+
 
 class Infer(diglib.infer.infer._Opt):
 
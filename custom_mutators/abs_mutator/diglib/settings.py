@@ -8,6 +8,8 @@ DBG = pdb.set_trace
 TMPDIR = Path("/tmp/")
 LOGGER_LEVEL = 0
 DO_MP = True  # use multiprocessing
+MP_POOL_SIZE = None  # number of pool workers, None means one per cpu
+MP_TIMES_SIZ = 1000  # workload timings kept per MP task (see MP.task_times)
 DO_SIMPLIFY = True  # simplify results, e.g., removing weaker invariants
 DO_FILTER = True  # remove ieqs and min/max terms that unlikely interesting
 DO_SS = True  # use symbolic states to check results
@@ -30,6 +32,7 @@ SE_DEPTH_NOCHANGES_MAX = 3
 SE_MAXDEPTH = 30
 SOLVER_TIMEOUT = 1  # secs
 EQT_RATE = 1.5
+EQT_FF_UKS = 20  # solve eqts with >= this many uks by modular/fraction-free elimination
 UGLY_FACTOR = 20  # remove equalities that have lots of terms and "large" coefficients
 MAX_TERM = 200
 
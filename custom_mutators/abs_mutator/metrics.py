@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Timings and counters of the mutator, aggregated in memory and written
+every few seconds as "key : value" lines, the format of fuzzer_stats.
+afl-fuzz appends $__AFL_OUT_DIR/custom_stats to its fuzzer_stats.
+
+To run doctest
+$ python3 -m doctest metrics.py
+"""
+
+import os
+import time
+
+
+class Histogram:
+    """
+    Durations in power of 2 buckets of microseconds
+
+    >>> h = Histogram()
+    >>> for secs in (0.000003, 0.001, 0.0012, 0.5):
+    ...     h.add(secs)
+    >>> h.count, round(h.total, 4), h.quantile(0.5), h.quantile(1.0)
+    (4, 0.5022, 0.001024, 0.5)
+    """
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * self.BUCKETS
+
+    def add(self, secs):
+        self.count += 1
+        self.total += secs
+        if secs > self.max:
+            self.max = secs
+        # bucket i holds [2^(i-1), 2^i) us
+        us = int(secs * 1e6)
+        self.buckets[min(us.bit_length(), self.BUCKETS - 1)] += 1
+
+    def quantile(self, q):
+        # upper bound of the bucket of the q-quantile, in seconds
+        n = q * self.count
+        seen = 0
+        for i, c in enumerate(self.buckets):
+            seen += c
+            if c and seen >= n:
+                return min((1 << i) / 1e6, self.max)
+        return 0.0
+
+
+class Metrics:
+    """
+    Histograms of phase durations, counters and gauges
+
+    >>> m = Metrics()
+    >>> m.time('walk', 0.0015)
+    >>> m.count('samples_new', 3)
+    >>> m.set('cache_bytes', 1024)
+    >>> print('\\n'.join(m.lines()))
+    abs_walk_count    : 1
+    abs_walk_total_s  : 0.002
+    abs_walk_p50_ms   : 1.500
+    abs_walk_p99_ms   : 1.500
+    abs_walk_max_ms   : 1.500
+    abs_cache_bytes   : 1024
+    abs_samples_new   : 3
+    """
+
+    def __init__(self, path=None, interval=5.0, prefix="abs_"):
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self.phases = {}
+        self.counters = {}
+        self.gauges = {}
+        self.last_flush = time.monotonic()
+
+    def time(self, phase, secs):
+        h = self.phases.get(phase)
+        if h is None:
+            h = self.phases[phase] = Histogram()
+        h.add(secs)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def get(self, name):
+        return self.counters.get(name, self.gauges.get(name, 0))
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def lines(self):
+        rs = []
+        for name, h in sorted(self.phases.items()):
+            rs.extend(((f"{name}_count", h.count),
+                       (f"{name}_total_s", f"{h.total:.3f}"),
+                       (f"{name}_p50_ms", f"{h.quantile(0.5) * 1e3:.3f}"),
+                       (f"{name}_p99_ms", f"{h.quantile(0.99) * 1e3:.3f}"),
+                       (f"{name}_max_ms", f"{h.max * 1e3:.3f}")))
+        rs.extend(sorted({**self.counters, **self.gauges}.items()))
+        return [f"{self.prefix + k:<18}: {v}" for k, v in rs]
+
+    def due(self):
+        # cheap enough to ask on every fuzz() call
+        return (self.path is not None
+                and time.monotonic() - self.last_flush >= self.interval)
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.path is None:
+            return
+
+        # readers never see a partial file
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write("\n".join(self.lines()) + "\n")
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
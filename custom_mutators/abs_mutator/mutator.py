@@ -1,42 +1,165 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-import sympy
 import random
-from diglib.helpers.miscs import Miscs
+from diglib.helpers.miscs import Miscs, MP
 import os
 from diglib import alg
 import time
-from pathlib import Path
 import logging
 from diglib.helpers.z3utils import Z3
 import walk_sample
+import metrics
 import numpy as np
 import pickle  
-import time
-
-
-# trace file
-trace_file = "/tmp/trace.csv"
-
-# inference results for incremental refiment and input generation
-dinvs = {}
+from collections import OrderedDict, deque
+import itertools
+
+
+# inference results for incremental refiment and input generation,
+# one SeedState per queue entry, least recently used first
+cache = OrderedDict()
+# state of the queue entry being fuzzed
+cur = None
+# seed (its key in cache) and arms of the sample each fuzz() call
+# emitted, by call number, until fuzz_feedback() reports how it did
+issued = OrderedDict()
+fuzz_calls = itertools.count()
 pos_vars = []
-samples = []
 
-leq_rhs_list = []
-leq_list = []
-leq_prob = {}
-eq_rhs_list = []
-eq_list = []
-eq_prob = {}
-
-# bound the number of used invariants
-inv_bound = 0
+# bound on the (estimated) memory of all cached states
+CACHE_MAX_BYTES = int(os.environ.get("ABS_CACHE_MB", "256")) * 2**20
+# re-infer a cached state only once its samples grew by this ratio
+CACHE_REFRESH_RATIO = 0.5
+
+# sample in a background process, fuzz() only takes what is ready
+BACKGROUND_SAMPLER = os.environ.get("ABS_SYNC_SAMPLER") is None
+sampler = None
+# sample the integer points of the polytope ('lattice'),
+# or real points that are then rounded ('dikin', 'hit-and-run')
+SAMPLER = os.environ.get("ABS_SAMPLER", "lattice")
+# forget the emitted byte vectors of a seed beyond this many
+SEEN_MAX = 1 << 16
+# run dig on at most this many effector bytes, the ones most related to
+# the outputs, as the template size grows fast with the number of variables
+DIG_MAX_VARS = int(os.environ.get("ABS_DIG_VARS", "16"))
+# samples emitted before drawing the constraint set to use again
+ARM_ROUND = 256
+# samples awaiting feedback, the oldest are forgotten beyond this many
+# (afl-fuzz reports every CUSTOM_FEEDBACK_BATCH = 64 runs)
+ISSUED_MAX = 4 * 64
+# samples buffered per seed, the oldest are dropped beyond this many
+SAMPLES_MAX = walk_sample.batch_size * walk_sample.buffer_batches
+
+# timings and counters, written every METRICS_INTERVAL secs to
+# ABS_METRICS_FILE or to the custom_stats afl-fuzz adds to fuzzer_stats
+METRICS_INTERVAL = 5.0
+if "ABS_METRICS_FILE" in os.environ:
+    metrics_path = os.environ["ABS_METRICS_FILE"]
+elif "__AFL_OUT_DIR" in os.environ:
+    metrics_path = os.path.join(os.environ["__AFL_OUT_DIR"], "custom_stats")
+else:
+    metrics_path = None
+stats = metrics.Metrics(metrics_path, METRICS_INTERVAL)
+
+class SeedState:
+    """
+    Inferred constraints, sampler state and sample pool of one queue entry
+    """
+
+    uids = itertools.count()
+
+    def __init__(self, pos, key=None):
+        self.uid = next(self.uids)
+        # its key in cache
+        self.key = key
+        self.pos = list(pos)
+        # positions dig runs on (and that are mutated),
+        # and their indices in pos
+        self.dig_pos = list(pos)
+        self.cols = list(range(len(pos)))
+
+        # DigTraces kept for incremental inference
+        self.dig = None
+        # number of samples afl-fuzz had taken (evicted ones included)
+        # when the invariants were inferred
+        self.n_inferred = 0
+        # bumped whenever the invariants are (re)inferred
+        self.generation = 0
+
+        self.dinvs = {}
+        self.samples = deque(maxlen=SAMPLES_MAX)
+        # chain sampled in the foreground and its polytope
+        self.chain = None
+        self.chain_key = None
+        # known integer solutions for the lattice sampler
+        self.starts = None
+        # byte vectors already emitted
+        self.seen = set()
+
+        self.leq_rhs_list = []
+        self.leq_list = []
+        self.eq_rhs_list = []
+        self.eq_list = []
+
+        # Beta(successes + 1, failures + 1) posterior of each constraint,
+        # by its row, so that it survives re-inference
+        self.arms = {}
+        # constraints in use (and their arms), samples left before drawing
+        # them again, and the arms of the last emitted sample
+        self.used = None
+        self.used_keys = None
+        self.draws_left = 0
+        self.pending = None
+
+        # bound the number of used invariants
+        self.inv_bound = 0
+        # number of (input and output) variables of the constraints
+        self.n_vars = 0
+
+    def nbytes(self):
+        # rough estimate: traces kept by dig, constraints (and their arms)
+        # and samples
+        n_traces = self.dig.dtraces.siz if self.dig is not None else 0
+        n_vars = len(self.pos) + 1
+        n_rows = len(self.leq_list) + len(self.eq_list) + len(self.arms)
+        return (n_traces * n_vars * 64 + n_rows * n_vars * 8 +
+                sum(getattr(w, 'nbytes', 64) for _, w in self.samples) +
+                len(self.seen) * (len(self.pos) + 40))
+
+def get_state(pos, seed_id):
+
+    global cur
+
+    # only the first call of a stage passes pos,
+    # the following ones keep fuzzing the same entry
+    if len(pos) == 0:
+        return cur
+
+    key = (seed_id, tuple(pos))
+    state = cache.pop(key, None)
+    if state is None:
+        stats.count('cache_misses')
+        state = SeedState(pos, key)
+    else:
+        stats.count('cache_hits')
+    cache[key] = state
+    cur = state
+    return state
+
+def evict():
+
+    nbytes = {key: state.nbytes() for key, state in cache.items()}
+    total = sum(nbytes.values())
+    # never evict the entry being fuzzed (the most recent one)
+    while total > CACHE_MAX_BYTES and len(cache) > 1:
+        key, _ = cache.popitem(last=False)
+        total -= nbytes[key]
+        stats.count('cache_evictions')
+    stats.set('cache_bytes', total)
 
 # related log
 # logger = logging.getLogger("infer.log")
-time_count = {'dig' : 0.0, 'post_dig' : 0.0, 'walk' : 0.0, 'dig_size' : 0, 'walk_size' : 0}
 
 def init(seed):
     # disable all log
@@ -44,136 +167,159 @@ def init(seed):
     pass
 
 def deinit():
-    pass
-
-def write_to_file(X, Y, pos):
-
-    f = open(trace_file, 'w')
-
-    assert(len(X[0]) == len(pos))
-    assert(len(pos) > 0)
-
-    # inv
+    # stop the diglib worker pool and the sampler
+    MP.shutdown()
+    flush_metrics()
+    if sampler is not None:
+        sampler.stop()
+
+def correlation(X, y):
+    """Absolute Pearson correlation of each column of X with y,
+    0 for constant columns"""
+    xc = X - X.mean(axis=0)
+    yc = y - y.mean()
+    den = np.sqrt((xc * xc).sum(axis=0) * (yc * yc).sum())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.abs(xc.T.dot(yc)) / den
+    return np.where(den > 0, r, 0.0)
+
+def mutual_information(X, y, bins=8):
+    """Mutual information of each (byte) column of X with y, in equal width
+    byte bins and equal frequency bins of y, normalized to [0, 1]"""
+    n, m = X.shape
+    xb = np.minimum(X.astype(np.int64) * bins // 256, bins - 1)
+    yb = np.searchsorted(np.quantile(y, np.linspace(0, 1, bins + 1)[1:-1]), y, side='right')
+
+    joint = np.zeros((m, bins, bins))
+    np.add.at(joint, (np.arange(m)[np.newaxis, :], xb, yb[:, np.newaxis]), 1)
+    joint /= n
+    px = joint.sum(axis=2, keepdims=True)
+    py = joint.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mi = np.nansum(joint * np.log(joint / (px * py)), axis=(1, 2))
+        hx = -np.nansum(px * np.log(px), axis=(1, 2))
+        hy = -np.nansum(py * np.log(py), axis=(1, 2))
+        nmi = mi / np.minimum(hx, hy)
+    return np.where(np.minimum(hx, hy) > 0, nmi, 0.0)
+
+def select_positions(X, Y, k):
+    """
+    Indices of the (at most) k columns of X most related to the outputs Y,
+    by absolute correlation or (for non-linear relations) mutual information
+
+    >>> X = [[i % 7, (i * 37) % 256, i % 3] for i in range(64)]
+    >>> select_positions(X, [[2 * x[1] + 1] for x in X], 1)
+    [1]
+    >>> select_positions(X, [[x[0] * x[2]] for x in X], 2)
+    [0, 2]
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    if X.shape[1] <= k:
+        return list(range(X.shape[1]))
+
+    scores = np.zeros(X.shape[1])
+    for y in Y.T:
+        scores = np.maximum(scores, correlation(X, y))
+        scores = np.maximum(scores, mutual_information(X, y))
+    # equal scores keep the byte order
+    return sorted(np.argsort(-scores, kind='stable')[:k].tolist())
+
+def set_pos_vars(Y, pos):
+
+    # variable names follow DigTraces.from_arrays
     # pos = [1, 30, 44, 55, 123...]
-    # vtrace1; I q; I r; I a; I b; I x; I y;
-    inv = "vtrace1"
+    # x_1, x_30, x_44, x_55, x_123, y_0
     pos_vars.clear()
     for p in pos:
-        inv += "; I x_{}".format(str(p))
         pos_vars.append("x_{}".format(str(p)))
     for i in range(0, len(Y[0])):
-        inv += "; I y_{}".format(str(i))
         pos_vars.append("y_{}".format(str(i)))
-    f.write(inv + "\n")
-
-    # file = open(pos_file, 'wb')
-    # pickle.dump(pos_vars, file)
-    # file.close()
-
-    # vtrace
-    # X = [[2, 3, 4, 5, 6...], [2, 3, 4, 5, 6...], [2, 3, 4, 5, 6...]]
-    # Y = [[2, 3, 4...], [2, 3, 4...], [2, 3, 4...]]
-    # vtrace1; 0; 282; 8; 64; 282; 8
-    trace_num = len(X)
-    for i in range(0, trace_num):
-
-        trace = "vtrace1"
-        
-        x_i = X[i]
-        y_i = Y[i]
-
-        for x in x_i:
-            trace += "; {}".format(x)
-        for y in y_i:
-            trace += "; {}".format(y)
-
-        f.write(trace + "\n")
-
-    f.close()
-
-def get_coeff(invs, pos):
-
-    eq_rhs = []
-    eq = []
-    for inv in invs:
-        s = str(inv)
-        expr = sympy.parse_expr(s)
-
-        # sympy cannot parse ==
-        if expr == False:
-            l = s.split(" ")
-            if len(l) == 3 and l[1] == "==":
-                rhs = int(l[2])
-                eq_rhs.append(rhs)
-
-                colist = []
-                for var in pos:
-                    if l[0] == sympy.symbols(var):
-                        colist.append(1)
-                    else:
-                        colist.append(0)
-                eq.append(colist)
-
-            else:
-                continue
-        else:
-
-            rhs = expr.rhs
-            if rhs.is_integer:
-                eq_rhs.append(int(expr.rhs))
-            else:
-                continue
 
-            colist = []
-            coes = expr.lhs.as_coefficients_dict()
-            for var in pos:
-                sym = sympy.symbols(var)
-                if sym in coes:
-                    colist.append(int(coes[sym]))
-                else:
-                    colist.append(0)
-            eq.append(colist)
+def runDig(state, X, Y, pos, sample_cnt):
 
-    return eq_rhs, eq
+    assert(len(X) > 0)
 
-def runDig(X, Y, pos):
+    assert(len(X[0]) == len(pos))
+    assert(len(pos) > 0)
 
-    assert(len(X) > 0)
+    # samples of the same seed only grow (X holds the last sample_cnt
+    # of them), so only the new ones need to be checked against the
+    # previous invariants, also once afl-fuzz evicted the oldest
+    if state.dig is not None and sample_cnt >= state.n_inferred:
+        # hot seed, reuse its invariants until enough new samples
+        if sample_cnt < state.n_inferred * (1 + CACHE_REFRESH_RATIO):
+            return
+        new = min(sample_cnt - state.n_inferred, len(X))
+        X, Y = X[len(X) - new:], Y[len(Y) - new:]
+    else:
+        state.dig = None
 
-    time_count['dig_size'] = time_count['dig_size'] + len(X)
+    # a new dig picks its positions, an incremental one keeps them
+    if state.dig is None:
+        state.cols = select_positions(X, Y, DIG_MAX_VARS)
+        state.dig_pos = [pos[c] for c in state.cols]
+    X = np.asarray(X)[:, state.cols]
+    pos = state.dig_pos
 
-    # write file
-    write_to_file(X, Y, pos)
+    stats.count('dig_samples', len(X))
 
-    # file read
-    inp = Path(trace_file)
+    set_pos_vars(Y, pos)
 
     # run dig
     try:
 
-        start = time.time()
-        dig = alg.DigTraces.mk(inp, None)
-        # {'vtrace1' : invariants}
-        dig_invs = dig.start(seed=round(time.time(), 2), maxdeg=None)
-        time_count['dig'] = time_count['dig'] + (time.time() - start)
-
-        start = time.time()
-        dinvs.clear()
+        start = time.perf_counter()
+        if state.dig is not None:
+            state.dig.time_d.clear()
+            dig_invs = state.dig.add_arrays(X, Y, pos)
+        else:
+            # build traces in memory
+            state.dig = alg.DigTraces.from_arrays(X, Y, pos)
+            # {'vtrace1' : invariants}
+            dig_invs = state.dig.start(seed=round(time.time(), 2), maxdeg=None)
+        state.n_inferred = sample_cnt
+        state.generation += 1
+        elapsed = time.perf_counter() - start
+        simplify = state.dig.time_d.get('simplify')
+        if simplify is not None:
+            stats.time('simplify', simplify)
+            elapsed -= simplify
+        stats.time('infer', elapsed)
+
+        start = time.perf_counter()
+        state.dinvs.clear()
         # persist invs
         for key in dig_invs:
-            dinvs[key] = dig_invs[key]
+            state.dinvs[key] = dig_invs[key]
 
         # sample parameter
-        loc = list(dinvs.keys())[0]
-        cinvs = dinvs[loc].cinvs
+        loc = list(state.dinvs.keys())[0]
+        cinvs = state.dinvs[loc].cinvs
 
-        inv_bound = len(X[0])
+        state.inv_bound = len(X[0])
+        state.n_vars = len(pos_vars)
+
+        # samples satisfy all the invariants, so they can start
+        # the chains on the integer points of the polytope
+        tm = state.dig.dtraces[loc].matrix
+        if tm is not None and tm.is_int:
+            idxs = np.random.choice(len(tm), min(len(tm), 256), replace=False)
+            state.starts = tm.vs[idxs]
 
         # total number of invs
         # count = len(cinvs.octs) + len(cinvs.eqts)
 
-        leq_rhs, leq = get_coeff(cinvs.octs, pos_vars)
-        eq_rhs, eq = get_coeff(cinvs.eqts, pos_vars)
+        stats.set('invs_eqt', len(cinvs.eqts) + len(cinvs.eqts_largecoefs))
+        stats.set('invs_oct', len(cinvs.octs))
+        stats.set('invs_mp', len(cinvs.mps))
+        stats.set('invs_other', len(cinvs.congruences) + len(cinvs.arr_rels))
+
+        (eq, eq_rhs), (leq, leq_rhs) = cinvs.to_matrix(pos_vars)
+        stats.set('rows_eq', len(eq))
+        stats.set('rows_le', len(leq))
+        eq, eq_rhs = eq.tolist(), eq_rhs.tolist()
+        leq, leq_rhs = leq.tolist(), leq_rhs.tolist()
         if len(eq) == 0:
             eq_rhs.append(0)
             eq.append([0] * len(pos_vars))
@@ -181,137 +327,301 @@ def runDig(X, Y, pos):
             leq_rhs.append(0)
             leq.append([0] * len(pos_vars))
 
-        leq_rhs_list.clear()
-        leq_list.clear()
-        eq_rhs_list.clear()
-        eq_list.clear()
-
-        count = 0
-        for item in leq_rhs:
-            leq_rhs_list.append(item)
-            leq_prob[count] = 1.0
-            count = count + 1
-
-        for item in leq:
-            leq_list.append(item)      
-
-        count = 0
-        for item in eq_rhs:
-            eq_rhs_list.append(item)
-            eq_prob[count] = 1.0
-            count = count + 1
+        state.leq_rhs_list.clear()
+        state.leq_list.clear()
+        state.eq_rhs_list.clear()
+        state.eq_list.clear()
 
-        for item in eq:
-            eq_list.append(item)
+        state.leq_rhs_list.extend(leq_rhs)
+        state.leq_list.extend(leq)
+        state.eq_rhs_list.extend(eq_rhs)
+        state.eq_list.extend(eq)
+        state.used = None
 
-        time_count['post_dig'] = time_count['post_dig'] + (time.time() - start)
+        stats.time('post_dig', time.perf_counter() - start)
         # print(leq_rhs_list, leq_list, eq_list, eq_list)
     except:
         pass
     
-def update_fitness(fitness):
-
-    if fitness > 0:
-        for index, prob in eq_prob.items():
-          eq_prob[index] += 0.1    
-
-        for index, prob in leq_prob.items():
-          leq_prob[index] += 0.1
-    else:
-        for index, prob in eq_prob.items():
-            eq_prob[index] -= 0.1
-              
-        for index, prob in leq_prob.items():
-            leq_prob[index] -= 0.1
-
-def mutate(buf, X, Y, pos):
-    
-    if len(dinvs) == 0:
-        return buf  
-
-    # if there are not enough samples, try to enlarge
-    # every time 512
-    start = time.time()
-    if len(samples) == 0:
-
-        # select based on prob
-        leq_rhs_list_used = []
-        leq_list_used = []
-        eq_rhs_list_used = []
-        eq_list_used = []
-
-        for index, prob in leq_prob.items():
-
-            if index >= len(leq_rhs_list) or index >= len(leq_list):
-                break
-
-            if prob > 0.5:
-                leq_rhs_list_used.append(leq_rhs_list[index])
-                leq_list_used.append(leq_list[index])
-
-            # bound
-            if len(leq_list_used) > inv_bound:
-                break
-
-        for index, prob in eq_prob.items():
-
-            if index >= len(eq_rhs_list) or index >= len(eq_list):
-                break
-
-            if prob > 0.5:
-                eq_rhs_list_used.append(eq_rhs_list[index])
-                eq_list_used.append(eq_list[index])                
-
-            # bound
-            if (len(leq_list_used) + len(eq_list_used)) > inv_bound:
-                break            
+def arm_key(state, kind, index):
+
+    if kind == 'eq':
+        return kind, tuple(state.eq_list[index]), state.eq_rhs_list[index]
+    return kind, tuple(state.leq_list[index]), state.leq_rhs_list[index]
+
+def draw_constraints(state):
+
+    # Thompson sampling: draw from the posterior of each constraint,
+    # and use the inv_bound constraints with the highest draws
+    rows = ([('eq', i) for i in range(len(state.eq_list))] +
+            [('leq', i) for i in range(len(state.leq_list))])
+    arms = [state.arms.get(arm_key(state, *row), (1, 1)) for row in rows]
+    draws = np.random.beta([a for a, _ in arms], [b for _, b in arms])
+    best = np.argsort(-draws, kind='stable')[:state.inv_bound]
+
+    state.used = tuple(sorted(rows[i] for i in best))
+    state.used_keys = [arm_key(state, *row) for row in state.used]
+    state.draws_left = ARM_ROUND
+    stats.count('arm_draws')
+
+def issue(state, keys):
+
+    # the seed is looked up again on feedback, as it may be evicted by then
+    issued[next(fuzz_calls)] = (state.key, keys)
+    if len(issued) > ISSUED_MAX:
+        # never reported, e.g., fuzz_feedback() is not called
+        issued.popitem(last=False)
+        stats.count('unreported')
+
+def settle(state, keys, success):
+
+    # credit the constraints a sample was drawn from
+    for key in keys:
+        arm = state.arms.setdefault(key, [1, 1])
+        arm[0 if success else 1] += 1
+    if success:
+        stats.count('arm_successes')
+
+def select_constraints(state):
+
+    if state.used is None or state.draws_left <= 0:
+        draw_constraints(state)
+    used = state.used
+
+    leq_rhs_list_used = [state.leq_rhs_list[i] for kind, i in used if kind == 'leq']
+    leq_list_used = [state.leq_list[i] for kind, i in used if kind == 'leq']
+    eq_rhs_list_used = [state.eq_rhs_list[i] for kind, i in used if kind == 'eq']
+    eq_list_used = [state.eq_list[i] for kind, i in used if kind == 'eq']
+
+    n = state.n_vars
+    leq_rhs = np.array(leq_rhs_list_used, dtype=np.int64)
+    leq = np.array(leq_list_used, dtype=np.int64).reshape(-1, n)
+    eq_rhs = np.array(eq_rhs_list_used, dtype=np.int64)
+    eq = np.array(eq_list_used, dtype=np.int64).reshape(-1, n)
+
+    # the polytope changes with the invariants and the selection
+    key = (state.uid, state.generation, tuple(used))
+    return key, (eq, eq_rhs, leq, leq_rhs)
+
+def get_sampler():
+
+    global sampler
+    if sampler is None or not sampler.proc.is_alive():
+        sampler = walk_sample.BackgroundSampler()
+    return sampler
+
+def refill(state):
+
+    samples = state.samples
+
+    # keep sampling the polytope of the constraints in use,
+    # continuing its chain, instead of refilling 512 points at a time
+    start = time.perf_counter()
+    key, constraints = select_constraints(state)
+    if key != state.chain_key:
+        # samples of other constraint sets of the same invariants are
+        # used up while the new chain warms up, credited to their sets
+        if state.chain_key is None or key[:2] != state.chain_key[:2]:
+            samples.clear()
+        state.chain = None
+        state.chain_key = key
+
+    starts = state.starts if SAMPLER == 'lattice' else None
+    try:
+        if BACKGROUND_SAMPLER:
+            bg = get_sampler()
+            if bg.active != key:
+                bg.set_polytope(key, *constraints, starts=starts)
+            # one batch at a time, as long as it fits without dropping any
+            if len(samples) + walk_sample.batch_size <= SAMPLES_MAX:
+                walks = bg.get(key)
+            else:
+                bg.send()
+                walks = []
+        elif len(samples) == 0:
+            if state.chain is None and starts is not None:
+                state.chain = walk_sample.lattice_chain(*constraints, starts)
+            elif state.chain is None:
+                state.chain = walk_sample.chain(*constraints, name=SAMPLER)
+            walks = walk_sample.take(state.chain, 512)
+        else:
+            walks = []
+        stats.count('samples', len(walks))
+        samples.extend((state.used_keys, w) for w in walks)
+    except:
+        state.chain = None
 
-        leq_rhs = np.array(leq_rhs_list_used)
-        leq = np.array(leq_list_used)
-        eq_rhs = np.array(eq_rhs_list_used)
-        eq = np.array(eq_list_used)              
-        # print(leq_rhs_list, leq_list, eq_list, eq_list)
-        try:
-            time_count['walk_size'] = time_count['walk_size'] + 512
-            walks = walk_sample.sample(eq, eq_rhs, leq, leq_rhs, 512)
-            for w in walks:
-                samples.append(w)
-        except:
-            pass
+    stats.time('walk', time.perf_counter() - start)
 
-    time_count['walk'] = time_count['walk'] + (time.time() - start)
+def take(state, n):
 
     # samples [x1, x2, x3, x4] 2 times:
     # [[1, 1, 1, 1], [2, 2, 2, 2]], each list is a set of byte values
-    if len(samples) > 0:
-        # print(samples)
-        sample = samples.pop()
-        # constructing the mutated buff
-        index = 0
-        for loc in pos:
-
-            if index == len(sample):
-                break
-
-            if sample[index] < 0 or sample[index] > 256:
-                buf[loc] = 0
-            else:
-                buf[loc] = int(sample[index])
-            index += 1
-    else:
-        pass
+    samples = state.samples
+    taken = []
+    k = len(state.dig_pos)
+    while len(samples) > 0 and len(taken) < n:
+        # byte values of the positions, real points are rounded
+        keys, point = samples.popleft()
+        sample = bytes(np.clip(np.rint(point[:k]), 0, 255).astype(np.uint8))
+
+        # skip byte vectors this seed already tried
+        if sample in state.seen:
+            stats.count('samples_dup')
+            continue
+        if len(state.seen) >= SEEN_MAX:
+            state.seen.clear()
+        state.seen.add(sample)
+        taken.append((keys, sample))
+
+    state.draws_left -= len(taken)
+    stats.count('samples_new', len(taken))
+    return taken
+
+def mutate(state, buf):
+    
+    if len(state.dinvs) == 0:
+        return buf  
 
+    refill(state)
+    start = time.perf_counter()
+    taken = take(state, 1)
+    if not taken:
+        # nothing (new) sampled yet, do not wait for it
+        stats.count('samples_miss')
+        return buf
+
+    # constructing the mutated buff
+    keys, sample = taken[0]
+    for loc, value in zip(state.dig_pos, sample):
+        buf[loc] = value
+    state.pending = keys
+    stats.time('marshal_out', time.perf_counter() - start)
     return buf
 
-def fuzz(buf, add_buf, max_size, X, Y, pos, incremental, fitness):
+def mutate_batch(state, buf, n):
+
+    if len(state.dinvs) == 0:
+        return [], None
+
+    refill(state)
+    taken = take(state, n)
+    if len(taken) < n:
+        # the samples ran out, take what the sampler has by now
+        refill(state)
+        taken += take(state, n - len(taken))
+    if not taken:
+        stats.count('samples_miss')
+        return [], None
+
+    # the mutants, one per row, with the sampled values at the positions
+    start = time.perf_counter()
+    rows = np.tile(np.frombuffer(bytes(buf), dtype=np.uint8), (len(taken), 1))
+    rows[:, state.dig_pos] = np.frombuffer(
+        b"".join(sample for _, sample in taken), dtype=np.uint8
+    ).reshape(len(taken), -1)
+    state.pending = taken[-1][0]
+    stats.time('marshal_out', time.perf_counter() - start)
+    return [keys for keys, _ in taken], rows
+
+def flush_metrics():
+
+    # derived values, and the times of the (background) sampling
+    new, dup = stats.get('samples_new'), stats.get('samples_dup')
+    stats.set('sample_accept', f"{new / max(new + dup, 1):.3f}")
+    hits, misses = stats.get('cache_hits'), stats.get('cache_misses')
+    stats.set('cache_hit_rate', f"{hits / max(hits + misses, 1):.3f}")
+    times = sampler.times if sampler is not None else walk_sample.times
+    stats.set('lp_total_s', f"{times['lp']:.3f}")
+    stats.set('sample_total_s', f"{times['sample']:.3f}")
+    stats.flush()
+
+def seed_state(X, Y, pos, incremental, seed_id, sample_cnt):
+
+    # X, Y and pos are read-only views of buffers afl-fuzz reuses after
+    # this call returns, wrap them without copying and copy what is kept
+    start = time.perf_counter()
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    pos = [int(p) for p in np.asarray(pos)]
+    stats.time('marshal_in', time.perf_counter() - start)
+
+    state = get_state(pos, seed_id)
+    if state is None:
+        return None
 
     if len(pos) > 0 and incremental > 0:
-        runDig(X, Y, pos)
-
-    update_fitness(fitness)
-    mutated_out = mutate(buf, X, Y, pos)
-    # logger.debug("related statistic: %s" % time_count)
-    print(time_count)
+        # without a count, no sample was evicted
+        runDig(state, X, Y, pos, len(X) if sample_cnt is None else sample_cnt)
+        evict()
+    return state
+
+def fuzz(buf, add_buf, max_size, X, Y, pos, incremental, fitness, seed_id=None,
+         sample_cnt=None):
+
+    state = seed_state(X, Y, pos, incremental, seed_id, sample_cnt)
+    if state is None:
+        next(fuzz_calls)
+        return buf
+
+    state.pending = None
+    mutated_out = mutate(state, buf)
+    if state.pending is not None:
+        issue(state, state.pending)
+    else:
+        next(fuzz_calls)
+    if stats.due():
+        flush_metrics()
     return mutated_out
 
-    
+def fuzz_batch(buf, add_buf, max_size, n, X, Y, pos, incremental, fitness,
+               seed_id=None, sample_cnt=None):
+
+    # the mutants of n fuzz() calls in one call, the rows of an array,
+    # as the samples are ready in batches anyway
+    state = seed_state(X, Y, pos, incremental, seed_id, sample_cnt)
+    if state is None:
+        next(fuzz_calls)
+        return [buf]
+
+    state.pending = None
+    arms, rows = mutate_batch(state, buf, n)
+    if stats.due():
+        flush_metrics()
+    if rows is None:
+        # nothing (new) sampled yet, run the seed as fuzz() does
+        next(fuzz_calls)
+        return [buf]
+
+    for keys in arms:
+        issue(state, keys)
+    return list(rows)
+
+def fuzz_feedback(results):
+
+    # (fuzz() call, new coverage, exec time, reach flag) of the last runs
+    for call, new_cov, exec_us, reached in results:
+        stats.time('exec', exec_us / 1e6)
+        if reached:
+            stats.count('reached')
+        key, keys = issued.pop(call, (None, None))
+        state = cache.get(key)
+        if state is not None:
+            # afl-fuzz samples (and dig infers the invariants of) the runs
+            # that do not reach the target, reaching it with a mutant of
+            # those is what afl-fuzz counts as a success of the seed too
+            settle(state, keys, new_cov or reached)
+
+    # the calls before the last one reported that are still waiting
+    # were not run, e.g., the mutant was empty or the entry abandoned
+    if results:
+        last = results[-1][0]
+        while issued and next(iter(issued)) <= last:
+            issued.popitem(last=False)
+            stats.count('unreported')
+
+def describe(max_description_len):
+
+    # afl-fuzz keeps the last sample (new coverage, crash or hang)
+    n = len(cur.pending) if cur is not None and cur.pending else 0
+    return f"abs,invs:{n}"[:max_description_len]
@@ -1,102 +1,212 @@
 #!/usr/bin/env python3
 
 import argparse
-from concurrent import futures
+from collections import OrderedDict
+import functools
+import multiprocessing
+import queue
+import time
 
 import numpy as np
+import sympy
 from scipy.optimize import linprog
 from matplotlib import pyplot as plt
 from six.moves import range
 
-chain_count = 1
+chain_count = 16
 burn = 1000
 thin = 10
+sampler_name = 'dikin'  # or 'hit-and-run'
 
-def hessian(a, b, x):
-    """Return log-barrier Hessian matrix at x."""
-    d = (b - a.dot(x))
-    s = d ** -2.0
-    return a.T.dot(np.diag(s)).dot(a)
+# discrete hit-and-run on the integer points of the polytope
+lattice_burn = 100
+lattice_thin = 1
+byte_max = 255
 
+# background sampler: points per batch, batches buffered, chains kept,
+# and known solutions sent along to start the integer chains from
+batch_size = 64
+buffer_batches = 16
+max_chains = 8
+max_starts = 2 * chain_count
 
-def local_norm(h, v):
-    """Return the local norm of v based on the given Hessian matrix."""
-    return v.T.dot(h).dot(v)
+# seconds spent in this process setting up polytopes (presolve, LP,
+# integer basis) and walking them
+times = {'lp': 0.0, 'sample': 0.0}
 
+def hessians(a, b, xs):
+    """Return the log-barrier Hessian matrices at each row of xs."""
+    d = b - xs.dot(a.T)
+    sa = a[np.newaxis] / d[:, :, np.newaxis]
+    return np.einsum('kmi,kmj->kij', sa, sa)
 
-def sample_ellipsoid(e, r):
-    """Return a point in the (hyper)ellipsoid uniformly sampled.
 
-    The ellipsoid is defined by the positive definite matrix, ``e``, and
-    the radius, ``r``.
+def dikin_walks(a, b, x0s, r=3/40):
+    """Generate points with Dikin walks, advancing all chains (the rows of
+    x0s) at once.
+
+    The Cholesky factor of each Hessian gives both the proposal and the
+    log-determinant for the acceptance test.
     """
-    # Generate a point on the sphere surface
-    p = np.random.normal(size=e.shape[0])
-    p /= np.linalg.norm(p)
+    xs = np.array(x0s, dtype=float)
+    k, n = xs.shape
+    l_x = np.linalg.cholesky(hessians(a, b, xs))
+    logdet_x = 2 * np.log(np.diagonal(l_x, axis1=1, axis2=2)).sum(axis=1)
 
-    # Scale to a point in the sphere volume
-    p *= np.random.uniform() ** (1.0/e.shape[0])
+    while True:
+        # Uniform points in the ellipsoids {z : (z-x)' H_x (z-x) <= r}
+        p = np.random.normal(size=(k, n))
+        p /= np.linalg.norm(p, axis=1)[:, np.newaxis]
+        p *= (np.random.uniform(size=k) ** (1.0/n))[:, np.newaxis]
+        dz = np.linalg.solve(np.swapaxes(l_x, 1, 2), p[:, :, np.newaxis])
+        zs = xs + np.sqrt(r) * dz[:, :, 0]
+
+        # Lazy chains, and proposals outside the polytope, stay put
+        move = np.random.uniform(size=k) >= 0.5
+        move &= (zs.dot(a.T) < b).all(axis=1)
+        if move.any():
+            z = zs[move]
+            l_z = np.linalg.cholesky(hessians(a, b, z))
+            logdet_z = 2 * np.log(np.diagonal(l_z, axis1=1, axis2=2)).sum(axis=1)
+
+            # x must be in the ellipsoid of z too
+            v = np.einsum('kij,kj->ki', np.swapaxes(l_z, 1, 2), xs[move] - z)
+            ok = (v * v).sum(axis=1) <= 1.0
+            # p = sqrt(det(H_z) / det(H_x))
+            logp = 0.5 * (logdet_z - logdet_x[move])
+            ok &= np.log(np.random.uniform(size=len(z))) < logp
+
+            idx = np.flatnonzero(move)[ok]
+            xs[idx] = z[ok]
+            l_x[idx] = l_z[ok]
+            logdet_x[idx] = logdet_z[ok]
+
+        yield xs.copy()
+
+
+def hit_and_runs(a, b, x0s):
+    """Generate points with Hit-and-run, advancing all chains (the rows of
+    x0s) at once."""
+    xs = np.array(x0s, dtype=float)
+    k, n = xs.shape
 
-    # Transform to a point in the ellipsoid
-    return np.sqrt(r) * np.linalg.cholesky(np.linalg.inv(e)).dot(p)
+    while True:
+        # Generate points on the sphere surface
+        d = np.random.normal(size=(k, n))
+        d /= np.linalg.norm(d, axis=1)[:, np.newaxis]
 
+        # Find closest boundary in each direction
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dist = (b - xs.dot(a.T)) / d.dot(a.T)
+        dist[~(dist > 0)] = np.inf
+        closest = dist.min(axis=1)
+        closest[np.isinf(closest)] = 0.0
 
-def ellipsoid_axes(e):
-    """Return matrix with columns that are the axes of the ellipsoid."""
-    w, v = np.linalg.eigh(e)
-    return v.dot(np.diag(w**(-1/2.0)))
+        xs += d * (closest * np.random.uniform(size=k))[:, np.newaxis]
 
+        yield xs.copy()
 
-def dikin_walk(a, b, x0, r=3/40):
-    """Generate points with Dikin walk."""
-    x = x0
-    h_x = hessian(a, b, x)
 
-    while True:
-        # if not (a.dot(x) <= b).all():
-            # continue
-            # print(a.dot(x) - b)
-            # raise Exception('Invalid state: {}'.format(x))
+def lattice_walks(a, b, x0s, basis):
+    """Generate integer points with discrete Hit-and-run, advancing all
+    chains (the rows of x0s, integer points with a.x <= b) at once.
 
-        if np.random.uniform() < 0.5:
-            yield x
-            continue
+    Each step moves along a random {-1, 0, 1} combination of the integer
+    basis columns, by an integer step drawn uniformly from those that stay
+    in the polytope, so points never leave the lattice.
+    """
+    xs = np.array(x0s, dtype=np.int64)
+    k = xs.shape[0]
+    r = basis.shape[1]
 
-        z = x + sample_ellipsoid(h_x, r)
-        h_z = hessian(a, b, z)
+    while True:
+        c = np.random.randint(-1, 2, size=(k, r))
+        c[np.arange(k), np.random.randint(r, size=k)] |= 1
+        d = c.dot(basis.T)
+
+        # largest integer steps t with t * a.d <= b - a.x
+        ad = d.dot(a.T)
+        slack = b - xs.dot(a.T)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            steps = np.floor_divide(slack, ad)
+            hi = np.where(ad > 0, steps, np.iinfo(np.int64).max).min(axis=1)
+            lo = np.where(ad < 0, -np.floor_divide(slack, -ad),
+                          np.iinfo(np.int64).min).max(axis=1)
+        fixed = (ad == 0).all(axis=1)
+        hi[fixed] = lo[fixed] = 0
+
+        t = lo + np.floor(np.random.uniform(size=k) * (hi - lo + 1)).astype(np.int64)
+        xs += t[:, np.newaxis] * d
+
+        yield xs.copy()
+
+
+def lattice_rows(leq, leq_rhs, n):
+    """Return integer leq, leq_rhs with the byte bounds added and zero,
+    duplicate and redundant rows removed (see bounded_rows)."""
+    leq = np.asarray(leq, dtype=np.int64).reshape(-1, n)
+    leq_rhs = np.asarray(leq_rhs, dtype=np.int64).reshape(-1)
+
+    # divide rows by their gcd, a.x <= b iff (a/g).x <= floor(b/g)
+    g = np.gcd.reduce(leq, axis=1)
+    nz = g > 0
+    leq = np.vstack((leq[nz] // g[nz, np.newaxis], leq[~nz]))
+    leq_rhs = np.concatenate((np.floor_divide(leq_rhs[nz], g[nz]), leq_rhs[~nz]))
+
+    a, b = bounded_rows(leq, leq_rhs, n)
+    return a.astype(np.int64), np.floor(b).astype(np.int64)
+
+
+def integer_nullspace(eq):
+    """Return a matrix whose columns are integer vectors spanning the
+    nullspace of eq (cached)."""
+    eq = np.asarray(eq, dtype=np.int64)
+    return _integer_nullspace(eq.shape, eq.tobytes())
+
+
+@functools.lru_cache(maxsize=64)
+def _integer_nullspace(shape, data):
+    eq = np.frombuffer(data, dtype=np.int64).reshape(shape)
+    if not shape[0]:
+        # no equalities (sympy would make a 0x0 matrix of them)
+        return np.eye(shape[1], dtype=np.int64)
+    eq = sympy.Matrix(eq.tolist())
+    vs = []
+    for v in eq.nullspace():
+        v = v * sympy.ilcm(1, *[x.q for x in v])
+        v = v / sympy.igcd(*v) if any(v) else v
+        vs.append([int(x) for x in v])
+    if not vs:
+        raise Exception('Only one solution in null space')
+    return np.array(vs, dtype=np.int64).T
 
-        if local_norm(h_z, x - z) > 1.0:
-            yield x
-            continue
 
-        p = np.sqrt(np.linalg.det(h_z) / np.linalg.det(h_x))
-        if p >= 1 or np.random.uniform() < p:
-            x = z
-            h_x = h_z
+def lattice_chain(eq, eq_rhs, leq, leq_rhs, starts, chains=None):
+    """Endless chain of integer points in [0, byte_max]^n satisfying the
+    constraints, from discrete Hit-and-run chains started at the rows of
+    starts (known integer solutions, e.g., the traces the constraints were
+    inferred from)."""
+    n = starts.shape[1]
+    start = time.perf_counter()
+    basis = integer_nullspace(eq)
+    a, b = lattice_rows(leq, leq_rhs, n)
+    times['lp'] += time.perf_counter() - start
 
-        yield x
+    starts = starts[(starts.dot(a.T) <= b).all(axis=1)]
+    if not len(starts):
+        raise Exception('No feasible integer point to start from')
 
+    x0s = starts[np.random.randint(len(starts), size=chains or chain_count)]
+    walks = lattice_walks(a, b, x0s, basis)
 
-def hit_and_run(a, b, x0):
-    """Generate points with Hit-and-run algorithm."""
-    x = x0
+    for i in range(lattice_burn):
+        next(walks)
 
     while True:
-        # if not (a.dot(x) <= b).all():
-        #     print(a.dot(x) - b)
-        #     raise Exception('Invalid state: {}'.format(x))
-
-        # Generate a point on the sphere surface
-        d = np.random.normal(size=a.shape[1])
-        d /= np.linalg.norm(d)
-
-        # Find closest boundary in the direction
-        dist = np.divide(b - a.dot(x), a.dot(d))
-        closest = dist[dist > 0].min()
-
-        x += d * closest * np.random.uniform()
-
-        yield x
+        for point in next(walks):
+            yield point
+        for _ in range(lattice_thin - 1):
+            next(walks)
 
 
 def chebyshev_center(a, b):
@@ -112,30 +222,324 @@ def chebyshev_center(a, b):
     return res.x[:-1]
 
 
-def collect_chain(sampler, count, burn, thin, *args, **kwargs):
-    """Use the given sampler to collect points from a chain.
+def bounded_rows(leq, leq_rhs, n, fixed=None):
+    """Return leq, leq_rhs with the byte bounds 0 <= x <= byte_max added
+    and zero, duplicate and (box-)redundant rows removed.
+
+    fixed maps variables to their values, their columns are dropped.
+    """
+    leq = np.asarray(leq, dtype=float).reshape(-1, n)
+    leq_rhs = np.asarray(leq_rhs, dtype=float).reshape(-1)
+    free = np.ones(n, dtype=bool)
+    if fixed:
+        idxs = list(fixed)
+        leq_rhs = leq_rhs - leq[:, idxs].dot([fixed[i] for i in idxs])
+        free[idxs] = False
+        leq = leq[:, free]
+
+    m = leq.shape[1]
+    a = np.vstack((leq, np.identity(m), -np.identity(m)))
+    b = np.concatenate((leq_rhs, np.full(m, byte_max), np.zeros(m)))
+
+    norms = np.linalg.norm(a, axis=1)
+    zero = norms == 0
+    if (b[zero] < 0).any():
+        raise Exception('Infeasible constraints')
+
+    # rows that hold for all points in the box
+    box_max = np.maximum(a, 0).sum(axis=1) * byte_max
+    keep = (box_max > b) & ~zero
+    keep[-2 * m:] = True
+
+    # positive multiples of a row are duplicates, keep the tightest
+    rows = {}
+    for i in np.flatnonzero(keep):
+        k = np.round(a[i] / norms[i], 9).tobytes()
+        if k not in rows or b[i] / norms[i] < b[rows[k]] / norms[rows[k]]:
+            rows[k] = i
+    idxs = sorted(rows.values())
+    return a[idxs], b[idxs]
+
+
+def presolve(eq, eq_rhs, leq, leq_rhs, n):
+    """Return (nullspace, x_p, a, b): the points satisfying the
+    constraints and the byte bounds are x_p + nullspace.dot(z), a.z <= b.
+
+    Variables fixed by an eq row over one variable are eliminated first.
+    """
+    eq = np.asarray(eq, dtype=float).reshape(-1, n)
+    eq_rhs = np.asarray(eq_rhs, dtype=float).reshape(-1)
+    eq_rhs = eq_rhs[np.abs(eq).sum(axis=1) > 0]
+    eq = eq[np.abs(eq).sum(axis=1) > 0]
+
+    fixed = {}
+    for row, rhs in zip(eq, eq_rhs):
+        nz = np.flatnonzero(row)
+        if len(nz) == 1:
+            fixed[nz[0]] = rhs / row[nz[0]]
+    free = np.array([i not in fixed for i in range(n)])
+
+    x_p = np.zeros(n)
+    for i, v in fixed.items():
+        x_p[i] = v
+    eq_rhs = eq_rhs - eq.dot(x_p)
+    eq = eq[:, free]
+    keep = np.abs(eq).sum(axis=1) > 0
+    if (np.abs(eq_rhs[~keep]) > 1e-9).any():
+        raise Exception('Infeasible constraints')
+    eq, eq_rhs = eq[keep], eq_rhs[keep]
+
+    # Find nullspace (and a particular solution) over the free variables
+    m = int(free.sum())
+    if len(eq):
+        u, s, vh = np.linalg.svd(eq)
+        rank = np.sum(s >= 1e-10)
+        x_f = np.linalg.lstsq(eq, eq_rhs, rcond=None)[0]
+    else:
+        rank = 0
+        vh = np.identity(m)
+        x_f = np.zeros(m)
+    if rank == 0:
+        nullspace_f = np.identity(m)
+    elif rank == vh.shape[0]:
+        raise Exception('Only one solution in null space')
+    else:
+        nullity = vh.shape[0] - rank
+        nullspace_f = vh[-nullity:].T
+    if nullspace_f.shape[1] == 0:
+        raise Exception('Only one solution in null space')
+
+    x_p[free] = x_f
+    nullspace = np.zeros((n, nullspace_f.shape[1]))
+    nullspace[free] = nullspace_f
+
+    # Polytope parameters
+    leq, leq_rhs = bounded_rows(leq, leq_rhs, n, fixed)
+    a = leq.dot(nullspace_f)
+    b = leq_rhs - leq.dot(x_f)
+
+    return nullspace, x_p, a, b
+
+
+# presolved polytopes and their centers, by constraint set
+polytopes = OrderedDict()
+polytopes_size = 64
+
+
+def polytope(eq, eq_rhs, leq, leq_rhs, n=None):
+    """Return (nullspace, x_p, a, b, x0): the polytope a.z <= b whose
+    points are x_p + nullspace.dot(z) (see presolve), and its Chebyshev
+    center x0 to start chains from.
+
+    Results are cached, so sampling the same constraints again skips the
+    SVD and the LP.
+    """
+    if n is None:
+        n = np.shape(eq)[-1] if np.size(eq) else np.shape(leq)[-1]
+    key = (n,) + tuple(np.asarray(x, dtype=float).tobytes()
+                       for x in (eq, eq_rhs, leq, leq_rhs))
+    if key in polytopes:
+        polytopes.move_to_end(key)
+        return polytopes[key]
+
+    nullspace, x_p, a, b = presolve(eq, eq_rhs, leq, leq_rhs, n)
+
+    # Initial point to start the chains from.
+    # Use the Chebyshev center.
+    x0 = chebyshev_center(a, b)
+
+    polytopes[key] = nullspace, x_p, a, b, x0
+    if len(polytopes) > polytopes_size:
+        polytopes.popitem(last=False)
+    return polytopes[key]
+
+
+def get_sampler(name=None):
+    """Return the (multi-chain) sampler and its extra arguments."""
+    name = name or sampler_name
+    if name == 'dikin':
+        dikin_radius = 1
+        return dikin_walks, (dikin_radius,)
+    elif name == 'hit-and-run':
+        return hit_and_runs, ()
+    else:
+        raise ValueError('Unknown sampler: {}'.format(name))
+
+
+def collect_chains(sampler, count, burn, thin, a, b, x0, chains, *args):
+    """Use the given sampler to collect points from chains run together.
 
     Args:
-        count: Number of points to collect.
-        burn: Number of points to skip at beginning of chain.
-        thin: Number of points to take from sampler for every point.
+        count: Number of points to collect (from all chains).
+        burn: Number of steps to skip at beginning of the chains.
+        thin: Number of steps to take for every point of each chain.
+        chains: Number of chains, all started from x0.
     """
-    chain = sampler(*args, **kwargs)
-    point = next(chain)
-    points = np.empty((count, point.shape[0]))
+    walks = sampler(a, b, np.tile(x0, (chains, 1)), *args)
+    for i in range(burn):
+        next(walks)
+
+    steps = -(-count // chains)
+    points = np.empty((steps * chains, len(x0)))
+    for i in range(steps):
+        points[i * chains:(i + 1) * chains] = next(walks)
+        for _ in range(thin - 1):
+            next(walks)
 
-    for i in range(burn - 1):
-        next(chain)
+    return points[:count]
 
-    for i in range(count):
-        points[i] = next(chain)
+
+def chain(eq, eq_rhs, leq, leq_rhs, name=None, chains=None):
+    """Endless chain of points (burnt in once, then thinned), taken in turn
+    from chains run together.
+
+    Unlike sample(), taking more points continues the same chains.
+    """
+    start = time.perf_counter()
+    nullspace, x_p, a, b, x0 = polytope(eq, eq_rhs, leq, leq_rhs)
+    times['lp'] += time.perf_counter() - start
+    sampler, sampler_args = get_sampler(name)
+    walks = sampler(a, b, np.tile(x0, (chains or chain_count, 1)), *sampler_args)
+
+    for i in range(burn):
+        next(walks)
+
+    while True:
+        for point in x_p + next(walks).dot(nullspace.T):
+            yield point
         for _ in range(thin - 1):
-            next(chain)
+            next(walks)
+
+
+def take(points, count):
+    """Return the next count points of a chain."""
+    start, lp = time.perf_counter(), times['lp']
+    try:
+        return [next(points) for _ in range(count)]
+    finally:
+        # a new chain sets up its polytope on the first point
+        times['sample'] += time.perf_counter() - start - (times['lp'] - lp)
 
-    return points
 
+class BackgroundSampler(object):
+    """Keep sampling the active polytope in a separate process.
 
-def sample(eq, eq_rhs, leq, leq_rhs, count):
+    The embedding fuzzer holds the GIL, so a thread would not run between
+    fuzz() calls.  The process continues the chain of each polytope it has
+    seen (up to max_chains) and puts batches of points, tagged with the
+    polytope key, into a bounded queue, so fuzz() never waits for sampling.
+    At most one (small) command is in the pipe at a time, so sending one
+    never blocks either: a newer polytope replaces the one not sent yet.
+    """
+
+    STOP = None
+
+    def __init__(self):
+        ctx = multiprocessing.get_context('fork')
+        # a Queue hands puts to a feeder thread, which barely runs while
+        # the fuzzer holds the GIL, a SimpleQueue writes the pipe directly
+        self.cmds = ctx.SimpleQueue()
+        self.out = ctx.Queue(maxsize=buffer_batches)
+        # commands read by the process so far
+        self.received = ctx.RawValue('L', 0)
+        self.proc = ctx.Process(target=self.run,
+                                args=(self.cmds, self.out, self.received,
+                                      batch_size, max_chains),
+                                daemon=True)
+        self.proc.start()
+        self.active = None
+        # commands sent, and the one waiting for the pipe to be read
+        self.sent = 0
+        self.pending = None
+        self.stats = {'batches': 0, 'dropped': 0}
+        # times of the sampling process, as of its last batch
+        self.times = dict(times)
+
+    def set_polytope(self, key, eq, eq_rhs, leq, leq_rhs, starts=None):
+        """Sample the polytope of key from now on (continuing its chain
+        if the process has one).  With starts, sample its integer points
+        (see lattice_chain), started from at most max_starts of them."""
+        if starts is not None and len(starts) > max_starts:
+            starts = starts[np.random.choice(len(starts), max_starts,
+                                             replace=False)]
+        self.active = key
+        self.pending = (key, (eq, eq_rhs, leq, leq_rhs, starts))
+        self.send()
+
+    def send(self):
+        """Send the pending command once the last one was read."""
+        if self.pending is not None and self.sent == self.received.value:
+            self.cmds.put(self.pending)
+            self.sent += 1
+            self.pending = None
+
+    def get(self, key):
+        """Return the next batch of points buffered for key (dropping the
+        ones of other polytopes before it), without blocking."""
+        self.send()
+        while True:
+            try:
+                k, batch, self.times = self.out.get_nowait()
+            except queue.Empty:
+                return []
+            if k == key:
+                self.stats['batches'] += 1
+                return batch
+            # sampled before switching to key
+            self.stats['dropped'] += 1
+
+    def stop(self):
+        if self.proc.is_alive():
+            self.cmds.put(self.STOP)
+            self.proc.join(1)
+            if self.proc.is_alive():
+                self.proc.terminate()
+
+    @classmethod
+    def run(cls, cmds, out, received, batch_size, max_chains):
+        chains = OrderedDict()
+        active = None
+        while True:
+            # wait for work if there is nothing to sample
+            if active is None or not cmds.empty():
+                cmd = cmds.get()
+            else:
+                cmd = False
+
+            if cmd is cls.STOP:
+                return
+            elif cmd:
+                received.value += 1
+                key, (eq, eq_rhs, leq, leq_rhs, starts) = cmd
+                if key not in chains:
+                    if starts is None:
+                        chains[key] = chain(eq, eq_rhs, leq, leq_rhs)
+                    else:
+                        chains[key] = lattice_chain(eq, eq_rhs, leq, leq_rhs, starts)
+                    if len(chains) > max_chains:
+                        chains.popitem(last=False)
+                chains.move_to_end(key)
+                active = key
+                continue
+
+            try:
+                batch = take(chains[active], batch_size)
+            except Exception:
+                # e.g., no Chebyshev center, nothing to sample
+                chains.pop(active, None)
+                active = None
+                continue
+
+            # wait for room, unless asked to switch polytopes
+            while cmds.empty():
+                try:
+                    out.put((active, batch, dict(times)), timeout=0.05)
+                    break
+                except queue.Full:
+                    pass
+
+
+def sample(eq, eq_rhs, leq, leq_rhs, count, name=None, chains=None):
     """Entry point."""
 
     # This example is based on a system of linear equalities and
@@ -170,52 +574,24 @@ def sample(eq, eq_rhs, leq, leq_rhs, count):
     #     -6, -1, 8, 4, 22, 10
     # ])
 
-    # Find nullspace
-    u, s, vh = np.linalg.svd(eq)
-    rank = np.sum(s >= 1e-10)
-    if rank == 0:
-        nullspace = np.identity(vh.shape[0])
-    elif rank == vh.shape[0]:
-        raise Exception('Only one solution in null space')
-    else:
-        nullity = vh.shape[0] - rank
-        nullspace = vh[-nullity:].T
-
-    # Polytope parameters
-    a = leq.dot(nullspace)
-    b = leq_rhs
-
-    # Initial point to start the chains from.
-    # Use the Chebyshev center.
-    x0 = chebyshev_center(a, b)
-    # print('Chebyshev center: {}'.format(x0.dot(nullspace.T)))
+    nullspace, x_p, a, b, x0 = polytope(eq, eq_rhs, leq, leq_rhs)
+    # print('Chebyshev center: {}'.format(x_p + x0.dot(nullspace.T)))
 
     # print('A= {}'.format(a))
     # print('b= {}'.format(b))
     # print('x0= {}'.format(x0))
 
-    sampler_name = 'dikin' # 'hit-and-run'
-
-    if sampler_name == 'dikin':
-        sampler = dikin_walk
-        dikin_radius = 1
-        sampler_args = (dikin_radius,)
-    else:
-        sampler = hit_and_run
-        sampler_args = ()
+    sampler, sampler_args = get_sampler(name)
 
-    # Collect chains in parallel
-    with futures.ProcessPoolExecutor() as executor:
-        fs = [executor.submit(collect_chain, sampler, count, burn, thin,
-                              a, b, x0, *sampler_args)
-              for c in range(chain_count)]
-        chains = [f.result() for f in futures.as_completed(fs)]
+    # Collect chains together, as one batch of points
+    chains = [collect_chains(sampler, count, burn, thin, a, b, x0,
+                             chains or chain_count, *sampler_args)]
 
     # Plot chains
     for chain_number, chain in enumerate(chains):
         # print('Chain {}/{}'.format(chain_number+1, chain_count))
 
-        points = chain.dot(nullspace.T)
+        points = x_p + chain.dot(nullspace.T)
         maxes = points.max(axis=0)
         mins = points.min(axis=0)
         margins = 0.1 * (maxes - mins)
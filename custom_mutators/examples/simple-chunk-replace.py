@@ -64,3 +64,21 @@ def fuzz(buf, add_buf, max_size):
 
     # Return data
     return ret
+
+
+def fuzz_batch(buf, add_buf, max_size, n, *args):
+    """
+    Called instead of fuzz() for n fuzzing iterations at once.
+
+    @type n: int
+    @param n: The number of mutated buffers to return.
+
+    @type args: tuple
+    @param args: Further arguments of afl-fuzz, unused here.
+
+    The other parameters are the ones of fuzz().
+
+    @rtype: list
+    @return: Up to n new bytearrays containing the mutated data
+    """
+    return [fuzz(buf, add_buf, max_size) for i in range(n)]
@@ -106,6 +106,42 @@ def fuzz(buf, add_buf, max_size):
     return data
 
 
+def fuzz_batch(buf, add_buf, max_size, n, *args):
+    """
+    Called for n fuzzing iterations at once, the AFL buffer is parsed only once.
+    """
+
+    global __mutator__
+
+    # Do we have a working mutator object?
+    if __mutator__ is None:
+        log("fuzz_batch(): Can't fuzz, no mutator available")
+        return [buf]
+
+    # Load XML from the AFL buffer, interpreted as a string
+    try:
+        __mutator__.init_from_string(str(buf))
+        log("fuzz_batch(): Mutator successfully initialized with AFL buffer")
+    except Exception:
+        log("fuzz_batch(): Can't initialize mutator with AFL buffer")
+        return [buf]
+
+    # Mutate the parsed input n times
+    mutants = []
+    for i in range(n):
+        __mutator__.reset()
+        try:
+            __mutator__.mutate(max=5)
+            mutants.append(bytearray(__mutator__.save_to_string()))
+        except Exception:
+            log("fuzz_batch(): Can't mutate input => returning buf")
+            mutants.append(buf)
+
+    log("fuzz_batch(): Returning %d mutants" % len(mutants))
+    return mutants
+
+
+
 # Main (for debug)
 if __name__ == "__main__":
 
@@ -140,15 +140,23 @@
 
 #define MINIMUM_RESTART_RATIO 0.05
 
+#define SAMPLE_MAX_BYTES (16 * 1024 * 1024)  // memory cap of the samples of a queue entry
+#define SAMPLE_EVICT_DIV 4  // when full, evict the oldest 1/SAMPLE_EVICT_DIV of the samples
+#define SAMPLE_FSRV_MAX 64  // maximum of AFL_SAMPLE_FORKSERVERS
+#define CUSTOM_FEEDBACK_BATCH 64  // custom mutations per fuzz_feedback call
+#define CUSTOM_FUZZ_BATCH 64  // maximum of mutants asked per fuzz_batch call
+
 typedef struct {
-    char **inputs;  // pointer to an array of input values
-    size_t **outputs;  // pointer to an array of output values
+    u8 *inputs;  // num_sample x input_length input values, row-major
+    size_t *outputs;  // num_sample x output_length output values, row-major
     size_t num_sample; // number of samples
     size_t input_length;  // input length
     size_t output_length;  // output length
     size_t* pos;        // pos array
     size_t pos_length; // pos array length
-    size_t capacity;   // maximum size of the samples;
+    size_t capacity;   // number of samples allocated
+    size_t max_sample; // number of samples that fit in SAMPLE_MAX_BYTES
+    size_t evicted;    // number of samples evicted so far
     long incremental;
     long fitness;
 } StringArray;
@@ -387,6 +395,8 @@ enum {
   /* 12 */ PY_FUNC_INTROSPECTION,
   /* 13 */ PY_FUNC_DESCRIBE,
   /* 14 */ PY_FUNC_FUZZ_SEND,
+  /* 15 */ PY_FUNC_FUZZ_FEEDBACK,
+  /* 16 */ PY_FUNC_FUZZ_BATCH,
   PY_FUNC_COUNT
 
 };
@@ -401,6 +411,8 @@ typedef struct py_mutator {
   u8    *fuzz_buf;
   size_t fuzz_size;
 
+  u8 *fuzz_batch_buf;
+
   Py_buffer post_process_buf;
 
   u8    *trim_buf;
@@ -409,6 +421,11 @@ typedef struct py_mutator {
   u8    *havoc_buf;
   size_t havoc_size;
 
+  /* views of the samples for fuzz() */
+  Py_buffer   sample_views[3];
+  Py_ssize_t  sample_shapes[3][2];
+  Py_ssize_t  sample_strides[3][2];
+
 } py_mutator_t;
 
 #endif
@@ -432,6 +449,17 @@ typedef struct MOpt_globals {
 
 extern char *power_names[POWER_SCHEDULES_NUM];
 
+enum {
+
+  /* 00 */ SAMPLE_DESIGN_UNIFORM,                 /* Independent uniform bytes */
+  /* 01 */ SAMPLE_DESIGN_LHS,                     /* Latin hypercube           */
+  /* 02 */ SAMPLE_DESIGN_HALTON,                  /* Scrambled Halton sequence */
+  SAMPLE_DESIGN_COUNT
+
+};
+
+extern char *sample_design_names[SAMPLE_DESIGN_COUNT];
+
 typedef struct afl_env_vars {
 
   u8 afl_skip_cpufreq, afl_exit_when_done, afl_no_affinity, afl_skip_bin_check,
@@ -709,6 +737,13 @@ typedef struct afl_state {
   char            *cmplog_binary;
   afl_forkserver_t cmplog_fsrv;     /* cmplog has its own little forkserver */
 
+  /* Invariant sampling */
+
+  u8                sample_design;    /* SAMPLE_DESIGN_* of the samples  */
+  u32               sample_fsrv_cnt;  /* forkservers running the samples */
+  afl_forkserver_t *sample_fsrv;      /* their forkservers and trace maps */
+  sharedmem_t      *sample_shm;
+
   /* Custom mutators */
   struct custom_mutator *mutator;
 
@@ -831,6 +866,17 @@ typedef struct afl_state {
 
 } afl_state_t;
 
+/* Result of running a mutant of afl_custom_fuzz or afl_custom_fuzz_batch */
+
+struct custom_feedback {
+
+  u64 id;                       /* the id-th mutant, counted from 0    */
+  u32 exec_us;                  /* run time, including saving it       */
+  u8  new_cov;                  /* queued, or saved as a crash         */
+  u8  side;                     /* trace_bits[MAP_SIZE], the reach flag */
+
+};
+
 struct custom_mutator {
 
   const char *name;
@@ -838,6 +884,7 @@ struct custom_mutator {
   void       *dh;
   u8         *post_process_buf;
   u8          stacked_custom_prob, stacked_custom;
+  u64         fuzz_cnt;                 /* mutants so far, for their ids */
 
   void *data;                                    /* custom mutator data ptr */
 
@@ -899,6 +946,28 @@ struct custom_mutator {
   size_t (*afl_custom_fuzz)(void *data, u8 *buf, size_t buf_size, u8 **out_buf,
                             u8 *add_buf, size_t add_buf_size, size_t max_size);
 
+  /**
+   * Perform n custom mutations on a given input at once, instead of calling
+   * afl_custom_fuzz n times
+   *
+   * (Optional)
+   *
+   * @param data pointer returned in afl_custom_init by this custom mutator
+   * @param[in] buf Pointer to the input data to be mutated
+   * @param[in] buf_size Size of the input data
+   * @param[out] out_buf the mutants, one after the other. The buffer belongs
+   *             to the mutator and must stay valid until its next call.
+   * @param[out] out_sizes Sizes of the mutants, an array of n entries
+   * @param[in] add_buf Buffer containing the additional test case
+   * @param[in] add_buf_size Size of the additional test case
+   * @param[in] max_size Maximum size of each mutant
+   * @param[in] n Number of mutants wanted
+   * @return Number of mutants, up to n. 0 ends the custom stage.
+   */
+  u32 (*afl_custom_fuzz_batch)(void *data, u8 *buf, size_t buf_size,
+                               u8 **out_buf, size_t *out_sizes, u8 *add_buf,
+                               size_t add_buf_size, size_t max_size, u32 n);
+
   /**
    * Describe the current testcase, generated by the last mutation.
    * This will be called, for example, to give the written testcase a name
@@ -914,6 +983,21 @@ struct custom_mutator {
    */
   const char *(*afl_custom_describe)(void *data, size_t max_description_len);
 
+  /**
+   * Report how the mutants of afl_custom_fuzz did when run, in batches of
+   * CUSTOM_FEEDBACK_BATCH executions and at the end of the custom stage.
+   * Mutants of size 0 are not run and not reported.
+   *
+   * (Optional)
+   *
+   * @param data pointer returned in afl_custom_init by this custom mutator
+   * @param[in] feedback The results, in the order the mutants were run
+   * @param[in] cnt Number of entries in feedback
+   */
+  void (*afl_custom_fuzz_feedback)(void                         *data,
+                                   const struct custom_feedback *feedback,
+                                   u32                           cnt);
+
   /**
    * A post-processing function to use right before AFL writes the test case to
    * disk in order to execute the target.
@@ -1099,6 +1183,7 @@ void                   finalize_py_module(void *);
 
 u32         fuzz_count_py(void *, const u8 *, size_t);
 void        fuzz_send_py(void *, const u8 *, size_t);
+void        fuzz_feedback_py(void *, const struct custom_feedback *, u32);
 size_t      post_process_py(void *, u8 *, size_t, u8 **);
 s32         init_trim_py(void *, u8 *, size_t);
 s32         post_trim_py(void *, u8);
@@ -1183,8 +1268,16 @@ u32  write_to_testcase(afl_state_t *, void **, u32, u32);
 u8   calibrate_case(afl_state_t *, struct queue_entry *, u8 *, u32, u8);
 u8   trim_case(afl_state_t *, struct queue_entry *, u8 *);
 u8   common_fuzz_stuff(afl_state_t *, u8 *, u32);
+u8   common_fuzz_result(afl_state_t *, u8 *, u32, u8);
 fsrv_run_result_t fuzz_run_target(afl_state_t *, afl_forkserver_t *fsrv, u32);
 
+/* Sample */
+
+u8   sample_fsrv_init(afl_state_t *);
+u32  sample_fuzz_batch(afl_state_t *, u8 *, u32, u32, u8 *, size_t *);
+void sample_fsrv_deinit(afl_state_t *);
+void sample_design(afl_state_t *, u8 *, u32, u32);
+
 /* Fuzz one */
 
 u8   fuzz_one_original(afl_state_t *);
@@ -185,6 +185,8 @@ static char *afl_environment_variables[] = {
     "AFL_PRELOAD",
     "AFL_TARGET_ENV",
     "AFL_PYTHON_MODULE",
+    "AFL_SAMPLE_DESIGN",
+    "AFL_SAMPLE_FORKSERVERS",
     "AFL_QEMU_CUSTOM_BIN",
     "AFL_QEMU_COMPCOV",
     "AFL_QEMU_COMPCOV_DEBUG",
@@ -203,6 +203,9 @@ u32  afl_fsrv_get_mapsize(afl_forkserver_t *fsrv, char **argv,
 void afl_fsrv_write_to_testcase(afl_forkserver_t *fsrv, u8 *buf, size_t len);
 fsrv_run_result_t afl_fsrv_run_target(afl_forkserver_t *fsrv, u32 timeout,
                                       volatile u8 *stop_soon_p);
+u8   afl_fsrv_start_target(afl_forkserver_t *fsrv, volatile u8 *stop_soon_p);
+fsrv_run_result_t afl_fsrv_wait_target(afl_forkserver_t *fsrv, u32 timeout,
+                                       volatile u8 *stop_soon_p);
 void              afl_fsrv_killall(void);
 void              afl_fsrv_deinit(afl_forkserver_t *fsrv);
 void              afl_fsrv_kill(afl_forkserver_t *fsrv);
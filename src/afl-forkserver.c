@@ -1340,10 +1340,6 @@ fsrv_run_result_t __attribute__((hot))
 afl_fsrv_run_target(afl_forkserver_t *fsrv, u32 timeout,
                     volatile u8 *stop_soon_p) {
 
-  s32 res;
-  u32 exec_ms;
-  u32 write_value = fsrv->last_run_timed_out;
-
 #ifdef __linux__
   if (fsrv->nyx_mode) {
 
@@ -1402,6 +1398,23 @@ afl_fsrv_run_target(afl_forkserver_t *fsrv, u32 timeout,
   }
 
 #endif
+
+  if (unlikely(!afl_fsrv_start_target(fsrv, stop_soon_p))) { return 0; }
+
+  return afl_fsrv_wait_target(fsrv, timeout, stop_soon_p);
+
+}
+
+/* Start the target on the current test case without waiting for it, so
+   several forkservers can run at once. Returns 0 if stop_soon was set
+   meanwhile. */
+
+u8 __attribute__((hot))
+afl_fsrv_start_target(afl_forkserver_t *fsrv, volatile u8 *stop_soon_p) {
+
+  s32 res;
+  u32 write_value = fsrv->last_run_timed_out;
+
   /* After this memset, fsrv->trace_bits[] are effectively volatile, so we
      must prevent any earlier operations from venturing into that
      territory. */
@@ -1472,6 +1485,20 @@ afl_fsrv_run_target(afl_forkserver_t *fsrv, u32 timeout,
 
   }
 
+  return 1;
+
+}
+
+/* Wait for the target started by afl_fsrv_start_target(), monitoring for
+   timeouts. Return status information. */
+
+fsrv_run_result_t __attribute__((hot))
+afl_fsrv_wait_target(afl_forkserver_t *fsrv, u32 timeout,
+                     volatile u8 *stop_soon_p) {
+
+  s32 res = 0;
+  u32 exec_ms;
+
   exec_ms = read_s32_timed(fsrv->fsrv_st_fd, &fsrv->child_status, timeout,
                            stop_soon_p);
 
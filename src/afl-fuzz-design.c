@@ -0,0 +1,153 @@
+/*
+   american fuzzy lop++ - sample designs
+   -------------------------------------
+
+   Now maintained by Marc Heuse <mh@mh-sec.de>,
+                        Heiko Eißfeldt <heiko.eissfeldt@hexco.de> and
+                        Andrea Fioraldi <andreafioraldi@gmail.com>
+
+   Copyright 2016, 2017 Google Inc. All rights reserved.
+   Copyright 2019-2023 AFLplusplus Project. All rights reserved.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at:
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+   Chooses the effector byte values of the invariant sampling stage
+   (AFL_SAMPLE_DESIGN). Independent uniform bytes leave parts of the byte
+   range unsampled and give the invariant inference badly conditioned
+   trace matrices, stratified designs spread the samples evenly instead.
+
+ */
+
+#include "afl-fuzz.h"
+
+char *sample_design_names[SAMPLE_DESIGN_COUNT] = {"uniform", "lhs", "halton"};
+
+/* Random permutation of 0..n-1 */
+
+static void design_perm(afl_state_t *afl, u32 *perm, u32 n) {
+
+  for (u32 i = 0; i < n; ++i) {
+
+    perm[i] = i;
+
+  }
+
+  for (u32 i = n; i > 1; --i) {
+
+    u32 j = rand_below(afl, i), tmp = perm[i - 1];
+    perm[i - 1] = perm[j];
+    perm[j] = tmp;
+
+  }
+
+}
+
+/* Latin hypercube column: the cnt values of byte d fall into cnt different
+   strata of [0, 256), in random order */
+
+static void design_lhs_column(afl_state_t *afl, u8 *values, u32 cnt, u32 dims,
+                              u32 d, u32 *perm) {
+
+  design_perm(afl, perm, cnt);
+
+  for (u32 i = 0; i < cnt; ++i) {
+
+    values[(size_t)i * dims + d] =
+        ((u64)perm[i] * 256 + rand_below(afl, 256)) / cnt;
+
+  }
+
+}
+
+static u32 next_prime(u32 n) {
+
+  for (++n;; ++n) {
+
+    u32 d = 2;
+    while (d * d <= n && n % d) {
+
+      ++d;
+
+    }
+
+    if (d * d > n) { return n; }
+
+  }
+
+}
+
+/* Scrambled Halton column: radical inverse of the sample index in base,
+   with the digits permuted randomly so that stages and bytes differ */
+
+static void design_halton_column(afl_state_t *afl, u8 *values, u32 cnt,
+                                 u32 dims, u32 d, u32 base, u32 *perm) {
+
+  design_perm(afl, perm, base);
+
+  for (u32 i = 0; i < cnt; ++i) {
+
+    double h = 0, f = 1.0 / base;
+    for (u32 k = i + 1; k; k /= base, f /= base) {
+
+      h += f * perm[k % base];
+
+    }
+
+    values[(size_t)i * dims + d] = (u8)(h * 256);
+
+  }
+
+}
+
+/* Fill values, cnt rows of dims bytes, with the effector byte values of the
+   samples of a stage */
+
+void sample_design(afl_state_t *afl, u8 *values, u32 cnt, u32 dims) {
+
+  if (!cnt || !dims) { return; }
+
+  if (afl->sample_design == SAMPLE_DESIGN_UNIFORM) {
+
+    for (size_t i = 0; i < (size_t)cnt * dims; ++i) {
+
+      values[i] = rand() % 256;
+
+    }
+
+    return;
+
+  }
+
+  u32 *perm = ck_alloc(cnt * sizeof(u32));
+  u32  base = 1;
+
+  for (u32 d = 0; d < dims; ++d) {
+
+    if (afl->sample_design == SAMPLE_DESIGN_HALTON && base < cnt) {
+
+      base = next_prime(base);
+
+    }
+
+    /* with base >= cnt the index has a single digit, and a scrambled
+       digit is a random permutation of strata, as in the hypercube */
+    if (afl->sample_design == SAMPLE_DESIGN_HALTON && base < cnt) {
+
+      design_halton_column(afl, values, cnt, dims, d, base, perm);
+
+    } else {
+
+      design_lhs_column(afl, values, cnt, dims, d, perm);
+
+    }
+
+  }
+
+  ck_free(perm);
+
+}
+
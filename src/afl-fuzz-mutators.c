@@ -250,6 +250,18 @@ struct custom_mutator *load_custom_mutator(afl_state_t *afl, const char *fn) {
 
   }
 
+  /* "afl_custom_fuzz_batch", optional */
+  mutator->afl_custom_fuzz_batch = dlsym(dh, "afl_custom_fuzz_batch");
+  if (!mutator->afl_custom_fuzz_batch) {
+
+    ACTF("optional symbol 'afl_custom_fuzz_batch' not found.");
+
+  } else {
+
+    OKF("Found 'afl_custom_fuzz_batch'.");
+
+  }
+
   /* "afl_custom_deinit", optional for backward compatibility */
   mutator->afl_custom_deinit = dlsym(dh, "afl_custom_deinit");
   if (!mutator->afl_custom_deinit) {
@@ -394,6 +406,18 @@ struct custom_mutator *load_custom_mutator(afl_state_t *afl, const char *fn) {
 
   }
 
+  /* "afl_custom_fuzz_feedback", optional */
+  mutator->afl_custom_fuzz_feedback = dlsym(dh, "afl_custom_fuzz_feedback");
+  if (!mutator->afl_custom_fuzz_feedback) {
+
+    ACTF("optional symbol 'afl_custom_fuzz_feedback' not found.");
+
+  } else {
+
+    OKF("Found 'afl_custom_fuzz_feedback'.");
+
+  }
+
   OKF("Custom mutator '%s' installed successfully.", fn);
 
   /* Initialize the custom mutator */
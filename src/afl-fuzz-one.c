@@ -365,7 +365,8 @@ static void locate_diffs(u8 *ptr1, u8 *ptr2, u32 len, s32 *first, s32 *last) {
 
 
 
-// initialize a new StringArray with the specified initial capacity
+// initialize a new StringArray with the specified initial capacity,
+// the sample matrices are allocated once the lengths are known
 StringArray* newStringArray(size_t initialCapacity) {
     StringArray *array = malloc(sizeof(StringArray));
     if (array == NULL) {
@@ -373,105 +374,93 @@ StringArray* newStringArray(size_t initialCapacity) {
         exit(1);
     }
 
-    array->inputs = malloc(initialCapacity * sizeof(char*));
-    if (array->inputs == NULL) {
-        fprintf(stderr, "Error: Failed to allocate memory for StringArray's strings.\n");
-        exit(1);
-    }
-
-    array->outputs = malloc(initialCapacity * sizeof(size_t*));
-    if (array->outputs == NULL) {
-        fprintf(stderr, "Error: Failed to allocate memory for StringArray's lengths.\n");
-        exit(1);
-    }
-
-    // array->pos = malloc(initialCapacity * sizeof(size_t));
-    // if (array->pos == NULL) {
-    //   fprintf(stderr, "Error: Failed to allocate memory for StringArray's lengths.\n");
-    //   exit(1);
-    // }
-
+    array->inputs = NULL;
+    array->outputs = NULL;
+    array->pos = NULL;
     array->input_length = 0;
     array->output_length = 0;
     array->pos_length = 0;
     array->num_sample = 0;
-    array->capacity = initialCapacity;
+    array->capacity = initialCapacity ? initialCapacity : INITIAL_CAPACITY;
+    array->max_sample = 0;
+    array->evicted = 0;
     array->incremental = 0;
     array->fitness = 0;
     return array;
 }
 
-// add a new string to the end of the StringArray
-void appendString(StringArray *array, const char *input, const size_t* output, const size_t* pos, size_t input_length, size_t output_length, size_t num_bytes) {
+// resize the sample matrices to hold capacity samples
+static void reserveStringArray(StringArray *array, size_t capacity) {
+    u8 *inputs = realloc(array->inputs, capacity * array->input_length);
+    if (inputs == NULL) {
+        fprintf(stderr, "Error: Failed to reallocate memory for StringArray's inputs.\n");
+        exit(1);
+    }
+    array->inputs = inputs;
+
+    size_t *outputs = realloc(array->outputs, capacity * array->output_length * sizeof(size_t));
+    if (outputs == NULL) {
+        fprintf(stderr, "Error: Failed to reallocate memory for StringArray's outputs.\n");
+        exit(1);
+    }
+    array->outputs = outputs;
+    array->capacity = capacity;
+}
+
+// drop the oldest count samples
+static void evictStringArray(StringArray *array, size_t count) {
+    size_t keep = array->num_sample - count;
+    memmove(array->inputs, array->inputs + count * array->input_length,
+            keep * array->input_length);
+    memmove(array->outputs, array->outputs + count * array->output_length,
+            keep * array->output_length * sizeof(size_t));
+    array->num_sample = keep;
+    array->evicted += count;
+}
+
+// add a new sample to the end of the StringArray
+void appendString(StringArray *array, const u8 *input, const size_t* output, const size_t* pos, size_t input_length, size_t output_length, size_t num_bytes) {
 
     if (!array->input_length) {
       array->input_length = input_length;
       array->output_length = output_length;
       array->pos = malloc((num_bytes + 1) * sizeof(size_t));
-      for (int i = 0; i < num_bytes; i++)
-      {
-        array->pos[i] = pos[i];
+      if (array->pos == NULL) {
+          fprintf(stderr, "Error: Failed to allocate memory for StringArray's pos.\n");
+          exit(1);
       }
+      memcpy(array->pos, pos, num_bytes * sizeof(size_t));
       array->pos_length = num_bytes;
-    }
 
-    if (array->num_sample == array->capacity) {
-        // resize the array by doubling its capacity
-        array->capacity *= 2;
-        array->inputs = realloc(array->inputs, array->capacity * sizeof(char*));
-        if (array->inputs == NULL) {
-            fprintf(stderr, "Error: Failed to reallocate memory for StringArray's strings.\n");
-            exit(1);
-        }
-        array->outputs = realloc(array->outputs, array->capacity * sizeof(size_t));
-        if (array->outputs == NULL) {
-            fprintf(stderr, "Error: Failed to reallocate memory for StringArray's lengths.\n");
-            exit(1);
-        }
+      size_t row_bytes = input_length + output_length * sizeof(size_t);
+      array->max_sample = row_bytes ? SAMPLE_MAX_BYTES / row_bytes : SAMPLE_MAX_BYTES;
+      if (!array->max_sample) array->max_sample = 1;
+      reserveStringArray(array, MIN(array->capacity, array->max_sample));
     }
-    // allocate memory for a copy of the string
-    char *new_sample = malloc(input_length + 1);
-    if (new_sample == NULL) {
-        fprintf(stderr, "Error: Failed to allocate memory for new input.\n");
-        exit(1);
+
+    if (array->num_sample == array->max_sample) {
+        // over the memory cap, evict the oldest samples in one go
+        evictStringArray(array, MAX(array->max_sample / SAMPLE_EVICT_DIV, 1));
     }
-    // copy the input into the new memory location
-    memcpy(new_sample, input, input_length);
-    new_sample[input_length] = '\0'; // add null terminator
 
-    size_t *new_fact = (size_t*)malloc((output_length + 1) * sizeof(size_t));
-    if (new_fact == NULL) {
-        fprintf(stderr, "Error: Failed to allocate memory for new fact.\n");
-        exit(1);
+    if (array->num_sample == array->capacity) {
+        // grow in bulk, doubling the capacity up to the memory cap
+        reserveStringArray(array, MIN(array->capacity * 2, array->max_sample));
     }
-    // copy the output into the new memory location
-    memcpy(new_fact, output, output_length * sizeof(size_t));
-    new_fact[output_length] = '\0'; // add null terminator
 
-    // add the new string to the end of the array
-    array->inputs[array->num_sample] = new_sample;
-    array->outputs[array->num_sample] = new_fact;
+    // copy the sample into its rows
+    memcpy(array->inputs + array->num_sample * input_length, input, input_length);
+    memcpy(array->outputs + array->num_sample * output_length, output,
+           output_length * sizeof(size_t));
     array->num_sample++;
 }
 
-// free the memory used by a StringArray and its strings
+// free the memory used by a StringArray and its samples
 void freeStringArray(StringArray *array) {
     if (array != NULL) {
-        if (array->inputs != NULL) {
-            for (size_t i = 0; i < array->num_sample; i++) {
-                free(array->inputs[i]);
-            }
-            free(array->inputs);
-        }
-        if (array->outputs != NULL) {
-            for (size_t i = 0; i < array->num_sample; i++) {
-                free(array->outputs[i]);
-            }
-            free(array->outputs);
-        }
-        if (array->pos != NULL) {
-            free(array->pos);
-        }
+        free(array->inputs);
+        free(array->outputs);
+        free(array->pos);
         free(array);
     }
 }
@@ -498,6 +487,26 @@ double get_pooled_standard_deviation(int buffer1[], int buffer2[], int size1, in
     return sqrt(pooled_variance);
 }
 
+// store the effector byte locations of the current entry in locations,
+// returns their number
+static u32 sample_locations(afl_state_t *afl, u32 len, size_t *locations) {
+  u32 location_index = 0;
+  for (int location = 0; location < (int)(len >> EFF_MAP_SCALE2); location++) { // EFF_APOS(len)
+    if(afl->queue_cur->eff_map && afl->queue_cur->eff_map[location]) {
+      locations[location_index] = location;
+      location_index += 1;
+    }            
+  }
+  return location_index;
+}
+
+// set the effector bytes of buf to the values of a sample
+static void sample_mutant(u8 *buf, const u8 *input, const size_t *locations, u32 input_length) {
+  for (u32 i = 0; i < input_length; i++) {
+    buf[locations[i]] = input[i];
+  }
+}
+
 int get_sample_size(int num_locations, double success_ratio) {
 
   return 1.96 * 1.96 * success_ratio * (1 - success_ratio) / (0.0 * 0.05);
@@ -982,29 +991,58 @@ custom_mutator_stage: ;
 
   OKF("sam%d", sample_size);
 
-  size_t input_length = 0;
   size_t output_length = 1;
   afl->queue_cur->samples->incremental = 0;
   afl->queue_cur->samples->fitness = 0;
   size_t* locations = malloc(sizeof(size_t) * len);
-  u8* input = malloc(sizeof(u8) * len);
-  size_t* output = malloc(sizeof(u32) * output_length);
+  size_t* output = malloc(sizeof(size_t) * output_length);
+  size_t input_length = sample_locations(afl, len, locations);
+  u32 num_samples = sample_size > 0 ? sample_size : 0;
+
+  // the effector byte values of all samples, one row per sample
+  u8* design = malloc(num_samples * input_length + 1);
+  if (!locations || !output || !design) { PFATAL("alloc"); }
+  sample_design(afl, design, num_samples, input_length);
+
+  if (afl->sample_fsrv_cnt > 1 && num_samples && sample_fsrv_init(afl)) {
+
+    // batched sampling: generate all mutants up front and run them on the
+    // sample forkservers at once
+    u8* mutants = malloc((size_t)num_samples * len);
+    u8* reached = malloc(num_samples);
+    size_t* outputs = malloc(sizeof(size_t) * num_samples);
+    if (!mutants || !reached || !outputs) { PFATAL("alloc"); }
+
+    for(u32 counter = 0; counter < num_samples; ++counter) {
+      u8* mutant = mutants + (size_t)counter * len;
+      memcpy(mutant, out_buf, len);
+      sample_mutant(mutant, design + counter * input_length, locations, input_length);
+    }
 
-  // start sampling
-  for(int counter = 0; counter < sample_size; ++counter) {
-    // memcpy(out_buf, in_buf, len);
-    u32 location_index = 0;
-    for (int location = 0; location < EFF_APOS(len); location++) {
-      if(afl->queue_cur->eff_map && afl->queue_cur->eff_map[location]) {
-        u8 mutation = rand() % 256; // random mutation value in range [0, mutation_range]
-        // OKF("mutate %d, %d", location, mutation);
-        out_buf[location] = mutation;
-        input[location_index] = mutation; 
-        locations[location_index] = location;
-        location_index += 1;
-      }            
+    u32 done = sample_fuzz_batch(afl, mutants, len, num_samples, reached, outputs);
+    for(u32 counter = 0; counter < done; ++counter) {
+      if(!reached[counter]) {
+        appendString(
+          afl->queue_cur->samples, 
+          design + counter * input_length, 
+          &outputs[counter], 
+          locations, 
+          input_length, 
+          output_length, 
+          input_length);
+      }
     }
-    if (!input_length) input_length = location_index;
+
+    free(mutants);
+    free(reached);
+    free(outputs);
+
+  } else {
+
+  // start sampling
+  for(u32 counter = 0; counter < num_samples; ++counter) {
+    u8* input = design + counter * input_length;
+    sample_mutant(out_buf, input, locations, input_length);
     // memcpy(values, out_buf, len);
     common_fuzz_stuff(afl, out_buf, len);
     if(!afl->fsrv.trace_bits[MAP_SIZE]) {
@@ -1021,6 +1059,13 @@ custom_mutator_stage: ;
     }
   }
 
+  }
+
+  // appendString copied the samples
+  free(locations);
+  free(output);
+  free(design);
+
   afl->queue_cur->samples->incremental = 1;
   afl->queue_cur->samples->fitness = 0; 
 
@@ -1063,7 +1108,7 @@ custom_mutator_stage: ;
 
   LIST_FOREACH(&afl->custom_mutator_list, struct custom_mutator, {
 
-    if (el->afl_custom_fuzz) {
+    if (el->afl_custom_fuzz || el->afl_custom_fuzz_batch) {
 
       afl->current_custom_fuzz = el;
 
@@ -1081,6 +1126,17 @@ custom_mutator_stage: ;
 
       afl->stage_short = el->name_short;
 
+      /* results of the runs not yet passed to afl_custom_fuzz_feedback */
+      struct custom_feedback feedback[CUSTOM_FEEDBACK_BATCH];
+      u32                    feedback_cnt = 0;
+
+      /* mutants of afl_custom_fuzz_batch, packed in batch_buf, not run yet */
+      u8    *batch_buf = NULL;
+      size_t batch_sizes[CUSTOM_FUZZ_BATCH];
+      size_t batch_off = 0;
+      u32    batch_cnt = 0;
+      u32    batch_cur = 0;
+
       if (afl->stage_max) {
 
         for (afl->stage_cur = 0; afl->stage_cur < afl->stage_max;
@@ -1091,8 +1147,10 @@ custom_mutator_stage: ;
           u8                 *new_buf = NULL;
           u32                 target_len = 0;
 
-          /* check if splicing makes sense yet (enough entries) */
-          if (likely(afl->ready_for_splicing_count > 1)) {
+          /* check if splicing makes sense yet (enough entries), and
+             if the mutator is called for this iteration */
+          if (likely(afl->ready_for_splicing_count > 1) &&
+              (!el->afl_custom_fuzz_batch || batch_cur == batch_cnt)) {
 
             /* Pick a random other queue entry for passing to external API
                that has the necessary length */
@@ -1114,11 +1172,38 @@ custom_mutator_stage: ;
 
           }
 
-          u8 *mutated_buf = NULL;
+          u8    *mutated_buf = NULL;
+          size_t mutated_size;
+
+          if (el->afl_custom_fuzz_batch) {
+
+            /* one call for the next mutants, at most the rest of the stage */
+            if (batch_cur == batch_cnt) {
+
+              batch_cnt = el->afl_custom_fuzz_batch(
+                  el->data, out_buf, len, &batch_buf, batch_sizes, new_buf,
+                  target_len, max_seed_size,
+                  MIN(afl->stage_max - afl->stage_cur, CUSTOM_FUZZ_BATCH));
+              batch_cur = 0;
+              batch_off = 0;
 
-          size_t mutated_size =
-              el->afl_custom_fuzz(el->data, out_buf, len, &mutated_buf, new_buf,
-                                  target_len, max_seed_size);
+              if (!batch_cnt) { break; }
+
+            }
+
+            mutated_buf = batch_buf + batch_off;
+            mutated_size = batch_sizes[batch_cur++];
+            batch_off += mutated_size;
+
+          } else {
+
+            mutated_size =
+                el->afl_custom_fuzz(el->data, out_buf, len, &mutated_buf,
+                                    new_buf, target_len, max_seed_size);
+
+          }
+
+          u64 mutant_id = el->fuzz_cnt++;
 
           afl->new_sample++;
 
@@ -1131,8 +1216,32 @@ custom_mutator_stage: ;
 
           if (mutated_size > 0) {
 
-            if (common_fuzz_stuff(afl, mutated_buf, (u32)mutated_size)) {
+            u64 exec_start =
+                el->afl_custom_fuzz_feedback ? get_cur_time_us() : 0;
+            u32 hit_cnt = afl->queued_items + afl->saved_crashes;
+            u8  abandon = common_fuzz_stuff(afl, mutated_buf, (u32)mutated_size);
+
+            if (el->afl_custom_fuzz_feedback) {
+
+              struct custom_feedback *fb = &feedback[feedback_cnt++];
+              fb->id = mutant_id;
+              fb->exec_us = get_cur_time_us() - exec_start;
+              fb->new_cov = afl->queued_items + afl->saved_crashes != hit_cnt;
+              fb->side = afl->fsrv.trace_bits[MAP_SIZE];
+
+              if (feedback_cnt == CUSTOM_FEEDBACK_BATCH || abandon) {
+
+                el->afl_custom_fuzz_feedback(el->data, feedback, feedback_cnt);
+                feedback_cnt = 0;
 
+              }
+
+            }
+
+            if (abandon) {
+
+              /* the mutants of the batch not run keep their ids */
+              el->fuzz_cnt += batch_cnt - batch_cur;
               goto abandon_entry;
 
             }
@@ -1171,6 +1280,12 @@ custom_mutator_stage: ;
 
         }
 
+        if (feedback_cnt) {
+
+          el->afl_custom_fuzz_feedback(el->data, feedback, feedback_cnt);
+
+        }
+
         // TODO: update the schedule
         if ((double)cnt_succuess/(double)afl->stage_max > 0.5) {
            afl->queue_cur->samples->fitness = 1;
@@ -74,14 +74,72 @@ static void *unsupported(afl_state_t *afl, unsigned int seed) {
   it just fills in `&py_mutator->something_buf, &py_mutator->something_size`. */
   #define BUF_PARAMS(name) (void **)&((py_mutator_t *)py_mutator)->name##_buf
 
-static size_t fuzz_py(void *py_mutator, u8 *buf, size_t buf_size, u8 **out_buf,
-                      u8 *add_buf, size_t add_buf_size, size_t max_size) {
+/* A read-only memoryview of the row-major matrix buf (rows x cols),
+   or of the vector buf (cols) if rows is 0 */
+static PyObject *sample_view_py(py_mutator_t *py, u32 idx, void *buf,
+                                size_t rows, size_t cols, size_t itemsize,
+                                char *format) {
+
+  static size_t empty;
+  Py_buffer    *view = &py->sample_views[idx];
+
+  memset(view, 0, sizeof(Py_buffer));
+  view->ndim = rows ? 2 : 1;
+  view->shape = py->sample_shapes[idx];
+  view->strides = py->sample_strides[idx];
+  if (rows) {
+
+    view->shape[0] = rows;
+    view->shape[1] = cols;
+    view->strides[0] = cols * itemsize;
+    view->strides[1] = itemsize;
 
-  size_t    mutated_size;
-  PyObject *py_args, *py_value;
-  py_args = PyTuple_New(8);
-  py_mutator_t *py = (py_mutator_t *)py_mutator;
+  } else {
+
+    view->shape[0] = cols;
+    view->strides[0] = itemsize;
+    rows = 1;
+
+  }
+
+  view->buf = buf && cols ? buf : &empty;
+  view->len = rows * cols * itemsize;
+  view->itemsize = itemsize;
+  view->readonly = 1;
+  view->format = format;
+
+  return PyMemoryView_FromBuffer(view);
+
+}
+
+static void sample_release_py(PyObject *view) {
+
+  /* after a failed call (which is fatal) keep its error for PyErr_Print() */
+  if (!PyErr_Occurred()) {
+
+    PyObject *py_value = PyObject_CallMethod(view, "release", NULL);
+
+    /* only fails while the view itself is exported */
+    if (!py_value) { PyErr_Clear(); }
+    Py_XDECREF(py_value);
+
+  }
+
+  Py_DECREF(view);
+
+}
+
+/* The arguments of fuzz() and, if n > 0, of fuzz_batch(): buf, add_buf,
+   max_size, n, and the samples of the queue entry. The sample views are
+   stored in views, to be released after the call. */
+static PyObject *fuzz_args_py(py_mutator_t *py, u8 *buf, size_t buf_size,
+                              u8 *add_buf, size_t add_buf_size,
+                              size_t max_size, u32 n, PyObject **views) {
+
+  PyObject    *py_args, *py_value;
   afl_state_t *afl = py->afl_state;
+  u32          idx = 0;
+  py_args = PyTuple_New(n ? 11 : 10);
 
   /* buf */
   py_value = PyByteArray_FromStringAndSize(buf, buf_size);
@@ -92,7 +150,7 @@ static size_t fuzz_py(void *py_mutator, u8 *buf, size_t buf_size, u8 **out_buf,
 
   }
 
-  PyTuple_SetItem(py_args, 0, py_value);
+  PyTuple_SetItem(py_args, idx++, py_value);
 
   /* add_buf */
   py_value = PyByteArray_FromStringAndSize(add_buf, add_buf_size);
@@ -103,7 +161,7 @@ static size_t fuzz_py(void *py_mutator, u8 *buf, size_t buf_size, u8 **out_buf,
 
   }
 
-  PyTuple_SetItem(py_args, 1, py_value);
+  PyTuple_SetItem(py_args, idx++, py_value);
 
   /* max_size */
   #if PY_MAJOR_VERSION >= 3
@@ -118,99 +176,101 @@ static size_t fuzz_py(void *py_mutator, u8 *buf, size_t buf_size, u8 **out_buf,
 
   }
 
-  PyTuple_SetItem(py_args, 2, py_value);
+  PyTuple_SetItem(py_args, idx++, py_value);
+
+  /* n, the number of mutants of fuzz_batch() */
+  if (n) { PyTuple_SetItem(py_args, idx++, PyLong_FromUnsignedLong(n)); }
 
   // sample, only done in the first stage
+  // X (inputs), Y (outputs) and pos are passed as memoryviews of the
+  // sample matrices, so python can wrap them without copying. They are
+  // only valid during the call: afl-fuzz moves and overwrites the rows
+  // as samples are added and evicted, and arrays or memoryviews wrapping
+  // the views keep pointing there, so the mutator copies what it keeps.
   PyObject *X, *Y, *pos, *incremental, *fitness;
   StringArray *samples = afl->queue_cur->samples;
-  X = PyList_New(0);
-  Y = PyList_New(0);
-  pos = PyList_New(0);
-  // PyObject **X_array = NULL;
-  // PyObject **Y_array = NULL;
-  // PyObject **pos_array = NULL;
+  size_t num_samples = 0, input_length = 0, output_length = 0, pos_length = 0;
+  u8 *inputs = NULL;
+  size_t *outputs = NULL;
+  if (afl->stage_cur == 0 && samples && samples->num_sample) {
+
+    num_samples = samples->num_sample;
+    input_length = samples->input_length;
+    output_length = samples->output_length;
+    pos_length = samples->pos_length;
+    inputs = samples->inputs;
+    outputs = samples->outputs;
+
+  }
+
+  X = sample_view_py(py, 0, inputs, num_samples, input_length, sizeof(u8),
+                     "B");
+  Y = sample_view_py(py, 1, outputs, num_samples, output_length,
+                     sizeof(size_t), "N");
+  pos = sample_view_py(py, 2, num_samples ? samples->pos : NULL, 0,
+                       pos_length, sizeof(size_t), "N");
   incremental = PyLong_FromLong(samples->incremental);
   fitness = PyLong_FromLong(samples->fitness);
-//  assert(samples->input_length == samples->pos_length);
-  if (afl->stage_cur == 0 && samples && samples->num_sample)
-  {
-    size_t num_samples = samples->num_sample;
-    // X_array = (PyObject **)malloc(num_samples * sizeof(PyObject*));
-    // Y_array = (PyObject **)malloc(num_samples * sizeof(PyObject*));
-    // OKF("sample size: %d", num_samples);
-    // OKF("input length: %d", samples->input_length);
-    for (size_t i = 0; i != num_samples; ++i) 
-    {
-      PyObject* x_i = PyList_New(samples->input_length);
-      // X_array[i] = x_i;
-      for (size_t j = 0; j != samples->input_length; j++)
-      {
-        PyList_SetItem(x_i, j, PyLong_FromLong(samples->inputs[i][j]));
-      }
-      PyList_Append(X, x_i);
-      Py_DECREF(x_i);
-
-      PyObject* y_i = PyList_New(samples->output_length);
-      // Y_array[i] = y_i;
-      for (size_t j = 0; j != samples->output_length; j++)
-      {
-        PyList_SetItem(y_i, j, PyLong_FromLong(samples->outputs[i][j]));
-      }      
-      PyList_Append(Y, y_i);
-      Py_DECREF(y_i);
-    }
+  if (!X || !Y || !pos) {
+
+    Py_DECREF(py_args);
+    FATAL("Failed to convert arguments");
 
-    // pos_array = (PyObject **)malloc(samples->pos_length * sizeof(PyObject*));
-    for (size_t i = 0; i != samples->pos_length; ++i) 
-    {
-      PyObject* p = PyLong_FromLong(samples->pos[i]);
-      PyList_Append(pos, p);
-      Py_DECREF(p);
-    }
   }
-//  else {return 0;}
 
-  PyTuple_SetItem(py_args, 3, X);
-  PyTuple_SetItem(py_args, 4, Y);
-  PyTuple_SetItem(py_args, 5, pos);
-  PyTuple_SetItem(py_args, 6, incremental);
-  PyTuple_SetItem(py_args, 7, fitness);
+  Py_INCREF(X);
+  Py_INCREF(Y);
+  Py_INCREF(pos);
+  views[0] = X;
+  views[1] = Y;
+  views[2] = pos;
+  PyTuple_SetItem(py_args, idx++, X);
+  PyTuple_SetItem(py_args, idx++, Y);
+  PyTuple_SetItem(py_args, idx++, pos);
+  PyTuple_SetItem(py_args, idx++, incremental);
+  PyTuple_SetItem(py_args, idx++, fitness);
+
+  /* seed id, lets the mutator keep per queue entry state */
+  PyTuple_SetItem(py_args, idx++,
+                  PyLong_FromUnsignedLong(afl->queue_cur->id));
+
+  /* number of samples taken so far, including the evicted ones: the rows
+     of X are the last ones of them, so the mutator can tell which are new
+     although eviction drops the first rows */
+  PyTuple_SetItem(py_args, idx++,
+                  PyLong_FromSize_t(samples->evicted + samples->num_sample));
+
+  return py_args;
+
+}
+
+/* the buffers are reused, make the views themselves unusable (arrays
+   wrapping them are not, see fuzz_args_py) */
+static void fuzz_release_py(PyObject **views) {
+
+  for (u32 i = 0; i < 3; ++i) {
+
+    sample_release_py(views[i]);
+
+  }
+
+}
+
+static size_t fuzz_py(void *py_mutator, u8 *buf, size_t buf_size, u8 **out_buf,
+                      u8 *add_buf, size_t add_buf_size, size_t max_size) {
+
+  size_t        mutated_size;
+  PyObject     *py_args, *py_value, *views[3];
+  py_mutator_t *py = (py_mutator_t *)py_mutator;
+
+  py_args = fuzz_args_py(py, buf, buf_size, add_buf, add_buf_size, max_size, 0,
+                         views);
 
   /* call python */
   py_value = PyObject_CallObject(py->py_functions[PY_FUNC_FUZZ], py_args);
 
-  /* free */
-  // if (X_array)
-  // {
-  //   for (int i = 0; i < samples->num_sample; i++) 
-  //   {
-  //     Py_DECREF(X_array[i]);
-  //   }
-  //   free(X_array);
-  // }
-  // if (Y_array)
-  // {
-  //   for (int i = 0; i < samples->num_sample; i++) 
-  //   {
-  //     Py_DECREF(Y_array[i]);
-  //   }
-  //   free(Y_array);
-  // }
-  // if (pos_array)
-  // {
-  //   for (int i = 0; i < samples->pos_length; i++) 
-  //   {
-  //     Py_DECREF(pos_array[i]);
-  //   }
-  //   free(pos_array);
-  // }
-  Py_DECREF(py_args);  
-  // Py_DECREF(Y);
-  // Py_DECREF(X);
-  // Py_DECREF(pos);
-  // Py_DECREF(incremental);
-  // Py_DECREF(fitness);
-  /* end free */
+  Py_DECREF(py_args);
+  fuzz_release_py(views);
 
   if (py_value != NULL) {
 
@@ -242,6 +302,87 @@ static size_t fuzz_py(void *py_mutator, u8 *buf, size_t buf_size, u8 **out_buf,
 
 }
 
+/* Copy the mutants of fuzz_batch(), a list of buffers, one after the other
+   into the batch buffer */
+static u32 fuzz_batch_copy_py(void *py_mutator, PyObject *py_value,
+                              u8 **out_buf, size_t *out_sizes, u32 n) {
+
+  size_t total = 0;
+  u32    cnt;
+
+  if (!PyList_Check(py_value)) {
+
+    FATAL("Python mutator fuzz_batch() should return a list of buffers, not %s",
+          Py_TYPE(py_value)->tp_name);
+
+  }
+
+  cnt = PyList_GET_SIZE(py_value);
+  if (cnt > n) {
+
+    FATAL("Python mutator fuzz_batch() returned %u mutants, not up to %u", cnt,
+          n);
+
+  }
+
+  for (u32 i = 0; i < cnt; ++i) {
+
+    Py_buffer mutant;
+    if (PyObject_GetBuffer(PyList_GET_ITEM(py_value, i), &mutant,
+                           PyBUF_C_CONTIGUOUS) == -1) {
+
+      PyErr_Print();
+      FATAL(
+          "Python mutator fuzz_batch() should return a list of buffers "
+          "(bytes, bytearray, ...), mutant %u is not one",
+          i);
+
+    }
+
+    out_sizes[i] = mutant.len;
+    *out_buf = afl_realloc(BUF_PARAMS(fuzz_batch), total + mutant.len + 1);
+    if (unlikely(!*out_buf)) { PFATAL("alloc"); }
+    memcpy(*out_buf + total, mutant.buf, mutant.len);
+    total += mutant.len;
+    PyBuffer_Release(&mutant);
+
+  }
+
+  return cnt;
+
+}
+
+static u32 fuzz_batch_py(void *py_mutator, u8 *buf, size_t buf_size,
+                         u8 **out_buf, size_t *out_sizes, u8 *add_buf,
+                         size_t add_buf_size, size_t max_size, u32 n) {
+
+  u32           cnt;
+  PyObject     *py_args, *py_value, *views[3];
+  py_mutator_t *py = (py_mutator_t *)py_mutator;
+
+  py_args = fuzz_args_py(py, buf, buf_size, add_buf, add_buf_size, max_size, n,
+                         views);
+
+  py_value = PyObject_CallObject(py->py_functions[PY_FUNC_FUZZ_BATCH], py_args);
+
+  Py_DECREF(py_args);
+  fuzz_release_py(views);
+
+  if (py_value != NULL) {
+
+    cnt = fuzz_batch_copy_py(py_mutator, py_value, out_buf, out_sizes, n);
+    Py_DECREF(py_value);
+    return cnt;
+
+  } else {
+
+    PyErr_Print();
+    FATAL("python custom fuzz_batch: call failed");
+
+  }
+
+}
+
 static const char *custom_describe_py(void  *py_mutator,
                                       size_t max_description_len) {
 
@@ -341,6 +482,10 @@ static py_mutator_t *init_py_module(afl_state_t *afl, u8 *module_name) {
         PyObject_GetAttrString(py_module, "queue_get");
     py_functions[PY_FUNC_FUZZ_SEND] =
         PyObject_GetAttrString(py_module, "fuzz_send");
+    py_functions[PY_FUNC_FUZZ_FEEDBACK] =
+        PyObject_GetAttrString(py_module, "fuzz_feedback");
+    py_functions[PY_FUNC_FUZZ_BATCH] =
+        PyObject_GetAttrString(py_module, "fuzz_batch");
     py_functions[PY_FUNC_QUEUE_NEW_ENTRY] =
         PyObject_GetAttrString(py_module, "queue_new_entry");
     py_functions[PY_FUNC_INTROSPECTION] =
@@ -510,6 +655,12 @@ struct custom_mutator *load_custom_mutator_py(afl_state_t *afl,
 
   if (py_functions[PY_FUNC_FUZZ]) { mutator->afl_custom_fuzz = fuzz_py; }
 
+  if (py_functions[PY_FUNC_FUZZ_BATCH]) {
+
+    mutator->afl_custom_fuzz_batch = fuzz_batch_py;
+
+  }
+
   if (py_functions[PY_FUNC_DESCRIBE]) {
 
     mutator->afl_custom_describe = custom_describe_py;
@@ -567,6 +718,12 @@ struct custom_mutator *load_custom_mutator_py(afl_state_t *afl,
 
   }
 
+  if (py_functions[PY_FUNC_FUZZ_FEEDBACK]) {
+
+    mutator->afl_custom_fuzz_feedback = fuzz_feedback_py;
+
+  }
+
   if (py_functions[PY_FUNC_QUEUE_NEW_ENTRY]) {
 
     mutator->afl_custom_queue_new_entry = queue_new_entry_py;
@@ -1017,6 +1174,52 @@ void fuzz_send_py(void *py_mutator, const u8 *buf, size_t buf_size) {
 
 }
 
+void fuzz_feedback_py(void *py_mutator, const struct custom_feedback *feedback,
+                      u32 cnt) {
+
+  PyObject *py_args, *py_list, *py_value;
+
+  /* a list of (id, new_cov, exec_us, side) tuples */
+  py_list = PyList_New(cnt);
+  if (!py_list) { FATAL("Failed to convert arguments"); }
+
+  for (u32 i = 0; i < cnt; ++i) {
+
+    py_value = Py_BuildValue("(KiIi)", (unsigned long long)feedback[i].id,
+                             feedback[i].new_cov, feedback[i].exec_us,
+                             feedback[i].side);
+    if (!py_value) {
+
+      Py_DECREF(py_list);
+      FATAL("Failed to convert arguments");
+
+    }
+
+    PyList_SET_ITEM(py_list, i, py_value);
+
+  }
+
+  py_args = PyTuple_New(1);
+  PyTuple_SetItem(py_args, 0, py_list);
+
+  py_value = PyObject_CallObject(
+      ((py_mutator_t *)py_mutator)->py_functions[PY_FUNC_FUZZ_FEEDBACK],
+      py_args);
+  Py_DECREF(py_args);
+
+  if (py_value != NULL) {
+
+    Py_DECREF(py_value);
+
+  } else {
+
+    PyErr_Print();
+    FATAL("python custom fuzz_feedback: call failed");
+
+  }
+
+}
+
 u8 queue_new_entry_py(void *py_mutator, const u8 *filename_new_queue,
                       const u8 *filename_orig_queue) {
 
@@ -1040,6 +1040,16 @@ common_fuzz_stuff(afl_state_t *afl, u8 *out_buf, u32 len) {
 
   fault = fuzz_run_target(afl, &afl->fsrv, afl->fsrv.exec_tmout);
 
+  return common_fuzz_result(afl, out_buf, len, fault);
+
+}
+
+/* Process the results of a run of out_buf, which are in afl->fsrv.trace_bits.
+   Returns 1 if it's time to bail out, like common_fuzz_stuff(). */
+
+u8 __attribute__((hot))
+common_fuzz_result(afl_state_t *afl, u8 *out_buf, u32 len, u8 fault) {
+
   if (afl->stop_soon) { return 1; }
 
   if (fault == FSRV_RUN_TMOUT) {
@@ -0,0 +1,257 @@
+/*
+   american fuzzy lop++ - batched invariant sampling
+   -------------------------------------------------
+
+   Now maintained by Marc Heuse <mh@mh-sec.de>,
+                        Heiko Eißfeldt <heiko.eissfeldt@hexco.de> and
+                        Andrea Fioraldi <andreafioraldi@gmail.com>
+
+   Copyright 2016, 2017 Google Inc. All rights reserved.
+   Copyright 2019-2023 AFLplusplus Project. All rights reserved.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at:
+
+     https://www.apache.org/licenses/LICENSE-2.0
+
+   Runs the samples of the invariant sampling stage on several forkservers
+   at once (AFL_SAMPLE_FORKSERVERS), each one with its own trace map and
+   test case file.
+
+ */
+
+#include "afl-fuzz.h"
+
+/* Copy afl->argv, pointing @@ at the test case file of a sample forkserver */
+
+static char **sample_argv(afl_state_t *afl, u8 *out_file) {
+
+  u32 argc = 0;
+  while (afl->argv[argc]) {
+
+    ++argc;
+
+  }
+
+  char **argv = ck_alloc((argc + 1) * sizeof(char *));
+
+  for (u32 i = 0; i < argc; ++i) {
+
+    u8 *at = afl->fsrv.out_file ? (u8 *)strstr(afl->argv[i], afl->fsrv.out_file)
+                                : NULL;
+
+    if (at) {
+
+      argv[i] = alloc_printf("%.*s%s%s", (int)(at - (u8 *)afl->argv[i]),
+                             afl->argv[i], out_file,
+                             at + strlen(afl->fsrv.out_file));
+
+    } else {
+
+      argv[i] = ck_strdup(afl->argv[i]);
+
+    }
+
+  }
+
+  return argv;
+
+}
+
+/* Start the sample forkservers, once. Returns 0 if the samples have to be
+   run serially through afl->fsrv instead. */
+
+u8 sample_fsrv_init(afl_state_t *afl) {
+
+  if (likely(afl->sample_fsrv)) { return 1; }
+  if (afl->sample_fsrv_cnt <= 1) { return 0; }
+
+  u8 *reason = NULL;
+  if (afl->non_instrumented_mode || afl->fsrv.use_fauxsrv) {
+
+    reason = "without a fork server";
+
+#ifdef __linux__
+
+  } else if (afl->fsrv.nyx_mode) {
+
+    reason = "in nyx mode";
+
+#endif
+
+  } else {
+
+    /* post_process is applied by write_to_testcase() for afl->fsrv only */
+    LIST_FOREACH(&afl->custom_mutator_list, struct custom_mutator, {
+
+      if (el->afl_custom_post_process) { reason = "with post_process"; }
+
+    });
+
+  }
+
+  if (reason) {
+
+    WARNF("AFL_SAMPLE_FORKSERVERS is not supported %s, sampling serially.",
+          reason);
+    afl->sample_fsrv_cnt = 0;
+    return 0;
+
+  }
+
+  ACTF("Spawning %u sample forkservers", afl->sample_fsrv_cnt);
+
+  /* each forkserver is told its trace map through the environment */
+  u8 *shm_env = getenv(SHM_ENV_VAR), *shm_fuzz_env = getenv(SHM_FUZZ_ENV_VAR);
+  if (shm_env) { shm_env = ck_strdup(shm_env); }
+  if (shm_fuzz_env) { shm_fuzz_env = ck_strdup(shm_fuzz_env); }
+  unsetenv(SHM_FUZZ_ENV_VAR);
+
+  afl->sample_fsrv =
+      ck_alloc(afl->sample_fsrv_cnt * sizeof(afl_forkserver_t));
+  afl->sample_shm = ck_alloc(afl->sample_fsrv_cnt * sizeof(sharedmem_t));
+
+  for (u32 i = 0; i < afl->sample_fsrv_cnt; ++i) {
+
+    afl_forkserver_t *fsrv = &afl->sample_fsrv[i];
+
+    afl_fsrv_init_dup(fsrv, &afl->fsrv);
+    fsrv->target_path = afl->fsrv.target_path;
+    fsrv->qemu_mode = afl->fsrv.qemu_mode;
+    fsrv->frida_mode = afl->fsrv.frida_mode;
+    fsrv->cs_mode = afl->fsrv.cs_mode;
+    fsrv->persistent_mode = afl->fsrv.persistent_mode;
+    fsrv->uses_asan = afl->fsrv.uses_asan;
+    fsrv->fsrv_kill_signal = afl->fsrv.fsrv_kill_signal;
+
+    /* test cases go through their own file, not the shared memory */
+    fsrv->support_shmem_fuzz = 0;
+    fsrv->out_file = alloc_printf(
+        "%s/.cur_sample_%u%s%s", afl->tmp_dir, i,
+        afl->file_extension ? "." : "",
+        afl->file_extension ? (char *)afl->file_extension : "");
+
+    unlink(fsrv->out_file);                                /* Ignore errors */
+    fsrv->out_fd = -1;
+    if (fsrv->use_stdin) {
+
+      fsrv->out_fd = open(fsrv->out_file, O_RDWR | O_CREAT | O_EXCL,
+                          DEFAULT_PERMISSION);
+      if (fsrv->out_fd < 0) { PFATAL("Unable to create '%s'", fsrv->out_file); }
+
+    }
+
+    fsrv->trace_bits = afl_shm_init(&afl->sample_shm[i], afl->fsrv.map_size + 32,
+                                    afl->non_instrumented_mode);
+
+    char **argv = sample_argv(afl, fsrv->out_file);
+    afl_fsrv_start(fsrv, argv, &afl->stop_soon, afl->afl_env.afl_debug_child);
+    for (u32 j = 0; argv[j]; ++j) {
+
+      ck_free(argv[j]);
+
+    }
+
+    ck_free(argv);
+
+  }
+
+  if (shm_env) {
+
+    setenv(SHM_ENV_VAR, shm_env, 1);
+    ck_free(shm_env);
+
+  }
+
+  if (shm_fuzz_env) {
+
+    setenv(SHM_FUZZ_ENV_VAR, shm_fuzz_env, 1);
+    ck_free(shm_fuzz_env);
+
+  }
+
+  OKF("Sample forkservers successfully started");
+  return 1;
+
+}
+
+/* Run the cnt test cases of len bytes in bufs, spread over the sample
+   forkservers, and process their results in order, like common_fuzz_stuff()
+   does. The reach flag and the output of each run are stored in reached and
+   outputs. Returns the number of test cases run, less than cnt if it's time
+   to bail out. */
+
+u32 sample_fuzz_batch(afl_state_t *afl, u8 *bufs, u32 len, u32 cnt,
+                      u8 *reached, size_t *outputs) {
+
+  u8 faults[SAMPLE_FSRV_MAX];
+
+  for (u32 base = 0; base < cnt; base += afl->sample_fsrv_cnt) {
+
+    u32 n = MIN(afl->sample_fsrv_cnt, cnt - base);
+
+    for (u32 j = 0; j < n; ++j) {
+
+      afl_forkserver_t *fsrv = &afl->sample_fsrv[j];
+      afl_fsrv_write_to_testcase(fsrv, bufs + (size_t)(base + j) * len, len);
+      if (!afl_fsrv_start_target(fsrv, &afl->stop_soon)) { return base; }
+
+    }
+
+    for (u32 j = 0; j < n; ++j) {
+
+      faults[j] = afl_fsrv_wait_target(&afl->sample_fsrv[j],
+                                       afl->fsrv.exec_tmout, &afl->stop_soon);
+
+    }
+
+    for (u32 j = 0; j < n; ++j) {
+
+      u8 *trace_bits = afl->sample_fsrv[j].trace_bits;
+
+      reached[base + j] = trace_bits[MAP_SIZE];
+      outputs[base + j] = trace_bits[MAP_SIZE + 8];
+
+      /* the results are processed as if afl->fsrv had run the test case */
+      memcpy(afl->fsrv.trace_bits, trace_bits, afl->fsrv.map_size + 32);
+      ++afl->fsrv.total_execs;
+
+      if (common_fuzz_result(afl, bufs + (size_t)(base + j) * len, len,
+                             faults[j])) {
+
+        return base + j + 1;
+
+      }
+
+    }
+
+  }
+
+  return cnt;
+
+}
+
+void sample_fsrv_deinit(afl_state_t *afl) {
+
+  if (!afl->sample_fsrv) { return; }
+
+  for (u32 i = 0; i < afl->sample_fsrv_cnt; ++i) {
+
+    afl_forkserver_t *fsrv = &afl->sample_fsrv[i];
+
+    afl_fsrv_deinit(fsrv);
+    afl_shm_deinit(&afl->sample_shm[i]);
+    if (fsrv->out_fd >= 0) { close(fsrv->out_fd); }
+    unlink(fsrv->out_file);                                /* Ignore errors */
+    ck_free(fsrv->out_file);
+
+  }
+
+  ck_free(afl->sample_fsrv);
+  ck_free(afl->sample_shm);
+  afl->sample_fsrv = NULL;
+  afl->sample_shm = NULL;
+
+}
+
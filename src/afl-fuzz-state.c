@@ -551,6 +551,50 @@ void read_afl_environment(afl_state_t *afl, char **envp) {
 
             }
 
+          } else if (!strncmp(env, "AFL_SAMPLE_DESIGN",
+
+                              afl_environment_variable_len)) {
+
+            u8 *design = (u8 *)get_afl_env(afl_environment_variables[i]);
+            u8  found = 0;
+            for (u32 d = 0; d < SAMPLE_DESIGN_COUNT; ++d) {
+
+              if (!strcasecmp(design, sample_design_names[d])) {
+
+                afl->sample_design = d;
+                found = 1;
+
+              }
+
+            }
+
+            if (!found) {
+
+              WARNF(
+                  "unknown AFL_SAMPLE_DESIGN '%s' (uniform, lhs or halton), "
+                  "using uniform samples.",
+                  design);
+
+            }
+
+          } else if (!strncmp(env, "AFL_SAMPLE_FORKSERVERS",
+
+                              afl_environment_variable_len)) {
+
+            int cnt = atoi((u8 *)get_afl_env(afl_environment_variables[i]));
+            if (cnt > 0 && cnt <= SAMPLE_FSRV_MAX) {
+
+              afl->sample_fsrv_cnt = cnt;
+
+            } else {
+
+              WARNF(
+                  "incorrect value for AFL_SAMPLE_FORKSERVERS environment "
+                  "variable, must be between 1 and %u, sampling serially.",
+                  SAMPLE_FSRV_MAX);
+
+            }
+
           }
 
         } else {
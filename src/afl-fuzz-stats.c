@@ -333,6 +333,23 @@ void write_stats_file(afl_state_t *afl, u32 t_bytes, double bitmap_cvg,
           : "default",
       afl->orig_cmdline);
 
+  /* "key : value" lines a custom mutator keeps in custom_stats */
+
+  snprintf(fn, PATH_MAX, "%s/custom_stats", afl->out_dir);
+  FILE *cf = fopen(fn, "r");
+  if (cf) {
+
+    char line[256];
+    while (fgets(line, sizeof(line), cf)) {
+
+      fputs(line, f);
+
+    }
+
+    fclose(cf);
+
+  }
+
   /* ignore errors */
 
   if (afl->debug) {
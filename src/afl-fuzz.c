@@ -293,6 +293,10 @@ static void usage(u8 *argv0, int more_help) {
 
       "AFL_PRELOAD: LD_PRELOAD / DYLD_INSERT_LIBRARIES settings for target\n"
       "AFL_TARGET_ENV: pass extra environment variables to target\n"
+      "AFL_SAMPLE_DESIGN: effector byte values of the invariant sampling stage:\n"
+      "                   uniform (default), lhs or halton\n"
+      "AFL_SAMPLE_FORKSERVERS: run the invariant sampling stage on this many\n"
+      "                        forkservers at once\n"
       "AFL_SHUFFLE_QUEUE: reorder the input queue randomly on startup\n"
       "AFL_SKIP_BIN_CHECK: skip afl compatibility checks, also disables auto map size\n"
       "AFL_SKIP_CPUFREQ: do not warn about variable cpu clocking\n"
@@ -2763,6 +2767,7 @@ stop_fuzzing:
 
   }
 
+  sample_fsrv_deinit(afl);
   afl_fsrv_deinit(&afl->fsrv);
 
   /* remove tmpfile */